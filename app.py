@@ -1,82 +1,459 @@
-from flask import Flask, request, jsonify, render_template
+from flask import Flask, request, jsonify, render_template, url_for
 from flask_cors import CORS
-from flask_sqlalchemy import SQLAlchemy
-import random
-import string
-import os
+from flask_socketio import SocketIO, join_room, leave_room
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.exc import IntegrityError, OperationalError
+from sqlalchemy.orm.attributes import set_committed_value
+import hashlib
 import json
-from datetime import datetime
-from open_ai.ai import generate_questions
-import uuid
+import os
+import threading
+from datetime import datetime, timedelta
+from sqlalchemy import inspect as sa_inspect, update
+from open_ai.ai import generate_questions, generate_question_batch, get_llm_stats, llm_available, set_fallback_source
+from open_ai.pool import QuestionPool
+from models import db, Answer, GameSession, LeaderboardEntry, Participant, ensure_schema
+from builtin_questions import questions
+import question_bank
+import question_pack
+import leaderboard
+import maintenance
+import metrics
+import scoring
+import stats
+from leaderboard import TopSnapshot
+from session_store import create_session_store
+from session_codes import CodeAllocator, CodesExhausted
 
 app = Flask(__name__, static_folder='static', template_folder='templates')
 CORS(app)
 
 basedir = os.path.abspath(os.path.dirname(__file__))
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + os.path.join(basedir, 'instance', 'quiz_game.db')
+app.config['SQLALCHEMY_DATABASE_URI'] = os.getenv(
+    'DATABASE_URL', 'sqlite:///' + os.path.join(basedir, 'instance', 'quiz_game.db')
+)
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {
+    'pool_size': int(os.getenv('DB_POOL_SIZE', '10')),
+    'max_overflow': int(os.getenv('DB_MAX_OVERFLOW', '20')),
+    'pool_timeout': float(os.getenv('DB_POOL_TIMEOUT', '10')),
+}
 
 os.makedirs(os.path.join(basedir, 'instance'), exist_ok=True)
 
-db = SQLAlchemy(app)
-
-class User(db.Model):
-    id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
-    username = db.Column(db.String(100), nullable=False)
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
-
-class GameSession(db.Model):
-    code = db.Column(db.String(3), primary_key=True)
-    student1_name = db.Column(db.String(100), nullable=False)
-    student2_name = db.Column(db.String(100), nullable=True)
-    student1_answers = db.Column(db.Text, default='[]')
-    student2_answers = db.Column(db.Text, default='[]')
-    student1_score = db.Column(db.Integer, default=0)
-    student2_score = db.Column(db.Integer, default=0)
-    status = db.Column(db.String(20), default='waiting')
-    current_question = db.Column(db.Integer, default=0)
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
-    
-    def get_student1_answers(self):
-        return json.loads(self.student1_answers)
-    
-    def set_student1_answers(self, answers_list):
-        self.student1_answers = json.dumps(answers_list)
-    
-    def get_student2_answers(self):
-        return json.loads(self.student2_answers)
-    
-    def set_student2_answers(self, answers_list):
-        self.student2_answers = json.dumps(answers_list)
-
-class LeaderboardEntry(db.Model):
-    id = db.Column(db.Integer, primary_key=True)
-    student1_name = db.Column(db.String(100), nullable=False)
-    student2_name = db.Column(db.String(100), nullable=False)
-    matching_answers = db.Column(db.Integer, nullable=False)
-    score = db.Column(db.Integer, nullable=False)
-    date = db.Column(db.DateTime, default=datetime.utcnow)
-
-active_sessions = {}
-
-questions = [
-    {"question": "Would you rather...", "option1": "Copy someone else's homework the morning it's due", "option2": "Pay someone to write your final paper"},
-    {"question": "Would you rather...", "option1": "Take an exam you didn't study for honestly", "option2": "Cheat but risk getting caught and failing the course"},
-    {"question": "Would you rather...", "option1": "Work with a friend on an assignment meant to be individual", "option2": "Turn in an assignment late and lose points"},
-    {"question": "Would you rather...", "option1": "Use ChatGPT to write your entire essay", "option2": "Submit a poorly written essay you actually wrote"},
-    {"question": "Would you rather...", "option1": "Let a classmate copy your work knowing they'll keep doing it", "option2": "Refuse to share and risk the friendship"},
-    {"question": "Would you rather...", "option1": "Take credit for a group project you barely contributed to", "option2": "Tell the professor you didn't do your fair share"},
-    {"question": "Would you rather...", "option1": "Use a fake excuse to get an extension", "option2": "Submit incomplete work on time"},
-    {"question": "Would you rather...", "option1": "Have your professor discover you plagiarized", "option2": "Never get caught but always know you cheated"},
-    {"question": "Would you rather...", "option1": "Share test questions with friends after taking an exam", "option2": "Keep them to yourself knowing others might fail"},
-    {"question": "Would you rather...", "option1": "Get an A by cheating in one important course", "option2": "Get a B by being honest in all your courses"}
-]
-
-def generate_session_code():
-    while True:
-        code = ''.join(random.choices(string.digits, k=3))
-        if code not in active_sessions and not GameSession.query.filter_by(code=code).first():
-            return code
+db.init_app(app)
+metrics.init_app(app)
+# Bound in create_app: picking the async mode imports eventlet, which CLI commands never need.
+socketio = SocketIO()
+_socketio_bound = False
+_schema_ready = False
+_init_lock = threading.Lock()
+
+active_sessions = create_session_store(os.path.join(basedir, 'instance'))
+completed_session_ttl = float(os.getenv('SESSION_STORE_COMPLETED_TTL', '300'))
+
+COMPLETED_CODE_GRACE = timedelta(seconds=int(os.getenv('SESSION_CODE_COMPLETED_GRACE', '600')))
+WAITING_SESSION_TTL = timedelta(seconds=int(os.getenv('SESSION_WAITING_TTL', '3600')))
+ABANDONED_SESSION_TTL = timedelta(seconds=int(os.getenv('SESSION_ABANDONED_TTL', '86400')))
+LEADERBOARD_RETENTION = timedelta(days=int(os.getenv('LEADERBOARD_RETENTION_DAYS', '0')))
+ARCHIVE_PATH = os.getenv('MAINTENANCE_ARCHIVE_PATH', os.path.join(basedir, 'instance', 'quiz_game_archive.db'))
+
+STATS_DEFAULT_DAYS = 30
+STATS_MAX_DAYS = 366
+STATS_DEFAULT_LIMIT = 10
+STATS_MAX_LIMIT = 100
+
+LEADERBOARD_DEFAULT_LIMIT = 50
+LEADERBOARD_MAX_LIMIT = 200
+leaderboard_snapshot = TopSnapshot(int(os.getenv('LEADERBOARD_CACHE_SIZE', '100')))
+
+QUESTIONS_PER_SESSION = 10
+ROOM_MAX_PARTICIPANTS = int(os.getenv('ROOM_MAX_PARTICIPANTS', '50'))
+SUBMIT_ATTEMPTS = int(os.getenv('SUBMIT_ATTEMPTS', '3'))
+
+question_pack_topics = [topic.strip().lower() for topic in os.getenv('QUESTION_PACK_TOPICS', '').split(',') if topic.strip()]
+question_pack_store = question_pack.load_pack(
+    os.getenv('QUESTION_PACK_PATH', os.path.join(basedir, 'instance', 'question_pack.db'))
+)
+
+def sample_pack(count, topic=None):
+    if question_pack_store is None:
+        return []
+    return question_pack_store.sample(count, [topic.lower()] if topic else question_pack_topics)
+
+if question_pack_store is not None:
+    set_fallback_source(sample_pack)
+
+def fallback_questions(count):
+    """A set from the question pack, or the built-in questions when there is no pack."""
+    sampled = sample_pack(count)
+    return sampled if len(sampled) == count else questions[:count]
+
+question_pool = QuestionPool(
+    metrics.timed(generate_questions),
+    set_size=QUESTIONS_PER_SESSION,
+    depth=int(os.getenv('QUESTION_POOL_DEPTH', '8')),
+    workers=int(os.getenv('QUESTION_POOL_WORKERS', '2')),
+    refill_interval=float(os.getenv('QUESTION_POOL_REFILL_INTERVAL', '0')),
+    refill_generator=metrics.timed(generate_question_batch),
+    max_sets_per_refill=int(os.getenv('QUESTION_POOL_SETS_PER_REFILL', '4')),
+)
+generate_streamed_questions = metrics.timed(generate_questions, 'stream_questions')
+personalise_questions = os.getenv('QUESTION_POOL_PERSONALISE', '0') == '1'
+stream_questions_enabled = os.getenv('QUESTION_STREAMING', '1') == '1'
+QUESTION_STREAM_TIMEOUT = timedelta(seconds=int(os.getenv('QUESTION_STREAM_TIMEOUT', '60')))
+QUESTION_STREAM_LIMIT = int(os.getenv('QUESTION_STREAM_LIMIT', '2'))
+streaming_sessions = set()
+streaming_lock = threading.Lock()
+
+def take_question_set():
+    return question_pool.take() or fallback_questions(QUESTIONS_PER_SESSION)
+
+def draw_session_questions(game_session_db, allow_stream=False):
+    fresh_source = question_pool.take if allow_stream else take_question_set
+    drawn = question_bank.draw_question_set(QUESTIONS_PER_SESSION, fresh_source)
+    if drawn is None:
+        # Nothing is ready; the set is streamed in once the session has been saved.
+        game_session_db.set_question_ids([])
+        game_session_db.questions_ready = False
+        return []
+    question_ids, session_questions = drawn
+    game_session_db.set_question_ids(question_ids)
+    game_session_db.questions_ready = True
+    bump_version(game_session_db)
+    return session_questions
+
+def load_session_questions(game_session_db):
+    session_questions = question_bank.load_questions(game_session_db.get_question_ids())
+    if len(session_questions) == QUESTIONS_PER_SESSION:
+        return session_questions
+    if not game_session_db.questions_ready and not question_stream_stalled(game_session_db):
+        return session_questions
+    if not session_questions:
+        return draw_session_questions(game_session_db)
+    return complete_question_set(game_session_db, session_questions)
+
+def question_stream_stalled(game_session_db):
+    if game_session_db.code in streaming_sessions:
+        return False
+    created_at = game_session_db.created_at or datetime.utcnow()
+    return datetime.utcnow() - created_at > QUESTION_STREAM_TIMEOUT
+
+def complete_question_set(game_session_db, session_questions):
+    present = {question_bank.content_hash(item) for item in session_questions}
+    missing = QUESTIONS_PER_SESSION - len(session_questions)
+    extra = []
+    for item in fallback_questions(QUESTIONS_PER_SESSION) + questions:
+        digest = question_bank.content_hash(item)
+        if len(extra) < missing and digest not in present:
+            present.add(digest)
+            extra.append(item)
+    completed = session_questions + extra
+    question_ids = question_bank.store_questions(completed)
+    question_bank.mark_used(question_ids[len(session_questions):])
+    game_session_db.set_question_ids(question_ids)
+    game_session_db.questions_ready = True
+    bump_version(game_session_db)
+    return completed
+
+def claim_question_stream(session_code):
+    # Each stream is a completion of its own, outside the batch coalescer, so a burst of
+    # pool misses beyond the limit gets the pack or built-in set and join swaps in a pool set.
+    with streaming_lock:
+        if len(streaming_sessions) >= QUESTION_STREAM_LIMIT:
+            return False
+        streaming_sessions.add(session_code)
+        return True
+
+def start_question_stream(session_code, student_name):
+    # A plain thread rather than socketio.start_background_task: the dev server runs
+    # eventlet without monkey patching, where a green thread would block on the HTTP call.
+    threading.Thread(
+        target=stream_session_questions,
+        args=(session_code, student_name),
+        name=f'question-stream-{session_code}',
+        daemon=True,
+    ).start()
+
+def stream_session_questions(session_code, student_name):
+    with app.app_context():
+        try:
+            for item in generate_streamed_questions(student_name, None, count=QUESTIONS_PER_SESSION, stream=True):
+                if not append_session_question(session_code, item):
+                    break
+        finally:
+            # Whatever stopped the stream, the set is completed from fallbacks and the thread's session released.
+            try:
+                db.session.rollback()
+                finish_question_stream(session_code)
+            finally:
+                streaming_sessions.discard(session_code)
+                db.session.remove()
+
+def append_session_question(session_code, item):
+    game_session_db = db.session.get(GameSession, session_code)
+    if game_session_db is None:
+        return False
+    question_ids = game_session_db.get_question_ids()
+    if len(question_ids) >= QUESTIONS_PER_SESSION:
+        return False
+    [question_id] = question_bank.store_questions([item])
+    if question_id in question_ids:
+        return True
+    question_bank.mark_used([question_id])
+    question_ids.append(question_id)
+    game_session_db.set_question_ids(question_ids)
+    game_session_db.questions_ready = len(question_ids) == QUESTIONS_PER_SESSION
+    bump_version(game_session_db)
+    db.session.commit()
+    publish_questions(session_code, game_session_db, question_bank.load_questions(question_ids), len(question_ids) - 1)
+    return True
+
+def finish_question_stream(session_code):
+    game_session_db = db.session.get(GameSession, session_code)
+    if game_session_db is None or game_session_db.questions_ready:
+        return
+    delivered = question_bank.load_questions(game_session_db.get_question_ids())
+    completed = complete_question_set(game_session_db, delivered)
+    db.session.commit()
+    publish_questions(session_code, game_session_db, completed, len(delivered))
+
+def publish_questions(session_code, game_session_db, session_questions, first_new_index):
+    game_session = active_sessions.get(session_code)
+    if game_session is not None:
+        set_questions(game_session, session_questions, game_session_db)
+        save_session(session_code, game_session)
+    for index in range(first_new_index, len(session_questions)):
+        broadcast_session_event(session_code, 'question_added', {
+            'index': index,
+            'question': session_questions[index]
+        })
+
+def replace_session_questions(session_code, game_session_db, new_questions):
+    question_ids = question_bank.store_questions(new_questions)
+    question_bank.mark_used(question_ids)
+    game_session_db.set_question_ids(question_ids)
+    bump_version(game_session_db)
+    game_session = active_sessions.get(session_code)
+    if game_session is not None:
+        set_questions(game_session, new_questions, game_session_db)
+        save_session(session_code, game_session)
+    broadcast_session_event(session_code, 'questions_updated', {'questions': new_questions})
+
+def upgrade_questions(session_code, student1_name, student2_name):
+    def apply(personalised):
+        with app.app_context():
+            game_session_db = db.session.get(GameSession, session_code)
+            if not game_session_db or any(game_session_db.answer_counts().values()):
+                return
+            replace_session_questions(session_code, game_session_db, personalised)
+            db.session.commit()
+
+    question_pool.personalise(student1_name, student2_name, apply)
+
+class VersionConflict(Exception):
+    pass
+
+def bump_version(game_session_db):
+    if sa_inspect(game_session_db).persistent:
+        # Incremented in SQL so concurrent writers never hand out the same version twice,
+        # and read back at once so the session can be built from it straight away.
+        version = db.session.execute(
+            update(GameSession)
+            .where(GameSession.code == game_session_db.code)
+            .values(version=GameSession.version + 1)
+            .returning(GameSession.version)
+            .execution_options(synchronize_session=False)
+        ).scalar_one()
+        set_committed_value(game_session_db, 'version', version)
+    else:
+        game_session_db.version = (game_session_db.version or 0) + 1
+
+def advance_version(game_session_db):
+    """Compare-and-swap: bump the version only if the row still has the version we read."""
+    expected = game_session_db.version
+    result = db.session.execute(
+        update(GameSession)
+        .where(GameSession.code == game_session_db.code, GameSession.version == expected)
+        .values(version=expected + 1)
+        .execution_options(synchronize_session=False)
+    )
+    if result.rowcount != 1:
+        raise VersionConflict(game_session_db.code)
+    set_committed_value(game_session_db, 'version', expected + 1)
+
+def question_set_key(session_questions):
+    payload = json.dumps(session_questions, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()[:16]
+
+def set_questions(game_session, session_questions, game_session_db):
+    game_session['questions'] = session_questions
+    game_session['questions_key'] = question_set_key(session_questions)
+    game_session['version'] = game_session_db.version or 0
+
+def session_state(session_code, game_session):
+    """The live part of a session; questions are fetched separately from ``questions_url``."""
+    return {
+        'session_code': session_code,
+        'version': game_session['version'],
+        'status': game_session['status'],
+        'current_question': game_session['current_question'],
+        'total_questions': QUESTIONS_PER_SESSION,
+        'questions_available': len(game_session['questions']),
+        'questions_key': game_session['questions_key'],
+        'questions_url': url_for('get_session_questions', session_code=session_code, key=game_session['questions_key']),
+        'max_participants': game_session['max_participants'],
+        'participants': game_session['participants'],
+        **student_aliases(game_session)
+    }
+
+def student_aliases(game_session):
+    # The two-player client addresses the first two participants as student1 and student2.
+    aliases = {}
+    for number in (1, 2):
+        if number <= len(game_session['participants']):
+            aliases[f'student{number}'] = game_session['participants'][number - 1]
+        else:
+            aliases[f'student{number}'] = {'number': number, 'name': '', 'answers': [], 'score': 0}
+    return aliases
+
+def current_question_index(*answer_counts):
+    return max(max(answer_counts), 1) - 1
+
+def load_participants(game_session_db, answers):
+    return [
+        {'number': participant.number, 'name': participant.name, 'answers': answers.get(participant.number, []), 'score': participant.score}
+        for participant in game_session_db.get_participants()
+    ]
+
+def build_session(game_session_db):
+    answers = game_session_db.get_answers()
+    game_session = {
+        'participants': load_participants(game_session_db, answers),
+        'max_participants': game_session_db.max_participants,
+        'status': game_session_db.status,
+        'current_question': current_question_index(*map(len, answers.values())),
+        'total_questions': QUESTIONS_PER_SESSION,
+        'created_at': game_session_db.created_at.isoformat() if game_session_db.created_at else datetime.now().isoformat()
+    }
+    set_questions(game_session, load_session_questions(game_session_db), game_session_db)
+    return game_session
+
+def refresh_session(game_session, game_session_db):
+    answers = game_session_db.get_answers()
+    game_session['participants'] = load_participants(game_session_db, answers)
+    game_session['max_participants'] = game_session_db.max_participants
+    game_session['status'] = game_session_db.status
+    game_session['current_question'] = current_question_index(*map(len, answers.values()))
+    if len(game_session.get('questions', [])) != QUESTIONS_PER_SESSION:
+        set_questions(game_session, load_session_questions(game_session_db), game_session_db)
+    game_session['version'] = game_session_db.version
+
+def load_session(session_code, game_session_db, refresh=False):
+    game_session = active_sessions.get(session_code)
+    if game_session is None or 'participants' not in game_session:
+        game_session = build_session(game_session_db)
+    elif refresh:
+        refresh_session(game_session, game_session_db)
+    elif len(game_session.get('questions', [])) != QUESTIONS_PER_SESSION:
+        set_questions(game_session, load_session_questions(game_session_db), game_session_db)
+    save_session(session_code, game_session)
+    return game_session
+
+def save_session(session_code, game_session):
+    ttl = completed_session_ttl if game_session['status'] == 'completed' else None
+    active_sessions.set(session_code, game_session, ttl=ttl)
+
+def load_used_session_codes():
+    return [code for (code,) in db.session.query(GameSession.code).all()]
+
+def reclaim_session_codes():
+    finished, expired = maintenance.stale_sessions(
+        datetime.utcnow(), COMPLETED_CODE_GRACE, WAITING_SESSION_TTL, ABANDONED_SESSION_TTL
+    )
+    maintenance.expire_sessions(expired)
+    maintenance.archive_sessions(finished, ARCHIVE_PATH)
+    codes = expired + finished
+    for code in codes:
+        active_sessions.delete(code)
+    return codes
+
+code_allocator = CodeAllocator(
+    load_used_session_codes,
+    reclaim_session_codes,
+    length=int(os.getenv('SESSION_CODE_LENGTH', '3')),
+    prefix=os.getenv('SESSION_CODE_PREFIX', ''),
+)
+
+def release_session_codes(codes):
+    for code in codes:
+        active_sessions.delete(code)
+        code_allocator.release(code)
+
+def run_maintenance(full_vacuum=False):
+    with app.app_context():
+        report = maintenance.run(
+            datetime.utcnow(),
+            COMPLETED_CODE_GRACE,
+            WAITING_SESSION_TTL,
+            ABANDONED_SESSION_TTL,
+            ARCHIVE_PATH,
+            leaderboard_retention=LEADERBOARD_RETENTION,
+            full_vacuum=full_vacuum,
+            release=release_session_codes,
+        )
+        if report['archived_leaderboard_entries']:
+            leaderboard_snapshot.invalidate()
+        db.session.remove()
+    return report
+
+maintenance_task = maintenance.MaintenanceTask(run_maintenance, float(os.getenv('MAINTENANCE_INTERVAL', '3600')))
+
+def broadcast_session_event(session_code, event, payload):
+    payload = dict(payload, session_code=session_code)
+    socketio.emit(event, payload, to=session_code)
+
+@socketio.on('watch_session')
+def watch_session(data):
+    session_code = (data or {}).get('session_code')
+    if session_code:
+        join_room(session_code)
+
+@socketio.on('unwatch_session')
+def unwatch_session(data):
+    session_code = (data or {}).get('session_code')
+    if session_code:
+        leave_room(session_code)
+
+def init_database():
+    """Bring the schema up to date, once per process."""
+    global _schema_ready
+    if _schema_ready:
+        return
+    with _init_lock:
+        if not _schema_ready:
+            with app.app_context():
+                ensure_schema()
+            _schema_ready = True
+
+def create_app():
+    """Finish setting up ``app``: bind Socket.IO and initialise the database.
+
+    WSGI servers should load ``app:create_app()``. Calling it again returns the same app.
+    """
+    global _socketio_bound
+    init_database()
+    if not _socketio_bound:
+        with _init_lock:
+            if not _socketio_bound:
+                socketio.init_app(app, cors_allowed_origins="*", message_queue=os.getenv('SOCKETIO_MESSAGE_QUEUE'))
+                _socketio_bound = True
+    return app
+
+@app.before_request
+def initialise_on_first_request():
+    # Covers servers pointed at the bare ``app:app``.
+    create_app()
 
 @app.route('/')
 def index():
@@ -86,35 +463,66 @@ def index():
 def create_session():
     data = request.json
     student_name = data.get('name', 'Student 1')
+    max_participants = data.get('max_participants', 2)
     
-    session_code = generate_session_code()
-    
-    game_session = GameSession(
-        code=session_code,
-        student1_name=student_name,
-        status='waiting'
-    )
-    db.session.add(game_session)
-    db.session.commit()
+    if not isinstance(max_participants, int) or not 2 <= max_participants <= ROOM_MAX_PARTICIPANTS:
+        return jsonify({'error': f'max_participants must be between 2 and {ROOM_MAX_PARTICIPANTS}'}), 400
     
-    try:
-        generated = generate_questions(student_name, None, count=10)
-        session_questions = generated if isinstance(generated, list) and len(generated) > 0 else questions
-    except Exception:
-        session_questions = questions
-
-    active_sessions[session_code] = {
-        'student1': {'name': student_name, 'answers': [], 'score': 0},
-        'student2': {'name': '', 'answers': [], 'score': 0},
+    session_code = None
+    for _ in range(5):
+        try:
+            candidate = code_allocator.allocate()
+        except CodesExhausted:
+            break
+        game_session_db = GameSession(
+            code=candidate,
+            student1_name=student_name,
+            status='waiting',
+            max_participants=max_participants,
+            participant_count=1
+        )
+        # Streaming only helps while the LLM can answer; otherwise the pack is as good and immediate.
+        allow_stream = (
+            stream_questions_enabled
+            and (question_pack_store is None or llm_available())
+            and claim_question_stream(candidate)
+        )
+        try:
+            session_questions = draw_session_questions(game_session_db, allow_stream=allow_stream)
+            db.session.add(game_session_db)
+            db.session.add(Participant(session_code=candidate, number=1, name=student_name))
+            db.session.commit()
+        except IntegrityError:
+            # Another worker took this code first.
+            db.session.rollback()
+            streaming_sessions.discard(candidate)
+            continue
+        except Exception:
+            streaming_sessions.discard(candidate)
+            raise
+        if game_session_db.questions_ready:
+            streaming_sessions.discard(candidate)
+        session_code = candidate
+        break
+    if session_code is None:
+        return jsonify({'error': 'No session codes available, please try again shortly'}), 503
+
+    game_session = {
+        'participants': [{'number': 1, 'name': student_name, 'answers': [], 'score': 0}],
+        'max_participants': max_participants,
         'status': 'waiting',
         'current_question': 0,
-        'questions': session_questions,
+        'total_questions': QUESTIONS_PER_SESSION,
         'created_at': datetime.now().isoformat()
     }
+    set_questions(game_session, session_questions, game_session_db)
+    save_session(session_code, game_session)
+    if not game_session_db.questions_ready:
+        start_question_stream(session_code, student_name)
     
     return jsonify({
         'session_code': session_code,
-        'session_data': active_sessions[session_code]
+        'state': session_state(session_code, game_session)
     })
 
 @app.route('/api/join_session', methods=['POST'])
@@ -127,55 +535,268 @@ def join_session():
     if not game_session_db:
         return jsonify({'error': 'Invalid session code'}), 404
     
-    if game_session_db.student2_name:
-        return jsonify({'error': 'Session is full'}), 400
+    if game_session_db.status == 'completed':
+        return jsonify({'error': 'Session has finished'}), 400
+    
+    # Claim the next seat in one statement so concurrent joins never share a number.
+    claimed = db.session.execute(
+        update(GameSession)
+        .where(
+            GameSession.code == session_code,
+            GameSession.status != 'completed',
+            GameSession.participant_count < GameSession.max_participants
+        )
+        .values(
+            participant_count=GameSession.participant_count + 1,
+            status='in_progress',
+            version=GameSession.version + 1
+        )
+        .returning(GameSession.participant_count, GameSession.version)
+        .execution_options(synchronize_session=False)
+    ).first()
+    if claimed is None:
+        db.session.rollback()
+        return jsonify({'error': 'Session is full or has started'}), 400
+    
+    participant_number, version = claimed
+    set_committed_value(game_session_db, 'participant_count', participant_number)
+    set_committed_value(game_session_db, 'status', 'in_progress')
+    set_committed_value(game_session_db, 'version', version)
+    db.session.add(Participant(session_code=session_code, number=participant_number, name=student_name))
+    if participant_number == 2:
+        game_session_db.student2_name = student_name
+
+    game_session = active_sessions.get(session_code)
+    if game_session is not None and len(game_session.get('participants', [])) == participant_number - 1:
+        game_session['participants'].append({'number': participant_number, 'name': student_name, 'answers': [], 'score': 0})
+        game_session['status'] = 'in_progress'
+        game_session['version'] = game_session_db.version
+        save_session(session_code, game_session)
+    else:
+        game_session = load_session(session_code, game_session_db, refresh=True)
+
+    # Answers already given belong to the set on screen, so only an untouched built-in set is swapped.
+    if game_session['questions'] == questions[:QUESTIONS_PER_SESSION] and not any(game_session_db.answer_counts().values()):
+        fresh_questions = question_pool.take()
+        if fresh_questions:
+            replace_session_questions(session_code, game_session_db, fresh_questions)
+
+    db.session.commit()
+
+    if personalise_questions and participant_number == 2:
+        upgrade_questions(session_code, game_session['participants'][0]['name'], student_name)
+
+    broadcast_session_event(session_code, 'player_joined', {
+        'student_number': participant_number,
+        'name': student_name,
+        'status': game_session['status']
+    })
+    
+    return jsonify({
+        'session_code': session_code,
+        'participant_number': participant_number,
+        'state': session_state(session_code, game_session)
+    })
+
+def complete_session(game_session_db):
+    """Score every participant from one agreement matrix; returns whether the leaderboard changed."""
+    answers = game_session_db.get_answers()
+    participants = game_session_db.get_participants()
+    matrix = scoring.answer_matrix(answers, [participant.number for participant in participants], QUESTIONS_PER_SESSION)
+    agreement = scoring.agreement_matrix(matrix)
+    for participant, score in zip(participants, scoring.participant_scores(agreement)):
+        participant.score = int(score)
+    
+    game_session_db.student1_score = participants[0].score
+    game_session_db.student2_score = participants[1].score
+    game_session_db.status = 'completed'
+    game_session_db.completed_at = datetime.utcnow()
+    stats.record_game(game_session_db, participants, matrix, agreement)
+    
+    # Two players make one leaderboard entry; larger rooms add each participant's closest match.
+    # The unique pair index makes a concurrent duplicate a no-op instead of a second row.
+    leaderboard_changed = False
+    for row, other, matching_answers in scoring.closest_pairs(agreement):
+        inserted = db.session.execute(
+            sqlite_insert(LeaderboardEntry)
+            .values(
+                student1_name=participants[row].name,
+                student2_name=participants[other].name,
+                matching_answers=matching_answers,
+                score=matching_answers * scoring.POINTS_PER_MATCH,
+                date=datetime.utcnow()
+            )
+            .on_conflict_do_nothing(index_elements=['student1_name', 'student2_name'])
+        ).rowcount
+        leaderboard_changed = leaderboard_changed or bool(inserted)
+    return leaderboard_changed
+
+def everyone_answered(game_session_db, answer_counts):
+    # Only a closed room completes: one that is full, or that its host has started.
+    return (
+        game_session_db.participant_count >= game_session_db.max_participants
+        and len(answer_counts) >= 2
+        and all(count == QUESTIONS_PER_SESSION for count in answer_counts.values())
+    )
+
+def broadcast_completion(session_code, game_session):
+    aliases = student_aliases(game_session)
+    broadcast_session_event(session_code, 'game_completed', {
+        'status': 'completed',
+        'scores': {entry['number']: entry['score'] for entry in game_session['participants']},
+        'student1_score': aliases['student1']['score'],
+        'student2_score': aliases['student2']['score']
+    })
+
+def record_answer(session_code, student_number, answer, question_index):
+    game_session_db = db.session.get(GameSession, session_code)
+    if not game_session_db:
+        return jsonify({'error': 'Session not found in database'}), 404
+    
+    if student_number not in game_session_db.participant_numbers():
+        return jsonify({'error': 'Invalid student number'}), 400
+    
+    game_session = load_session(session_code, game_session_db)
+    if len(game_session['participants']) != game_session_db.participant_count:
+        # Someone joined through another worker since this copy was cached.
+        game_session['participants'] = load_participants(game_session_db, game_session_db.get_answers())
+    
+    total_q = QUESTIONS_PER_SESSION
+    answer_counts = game_session_db.answer_counts()
+    current_answer_count = answer_counts[student_number]
+    
+    if question_index is None:
+        if current_answer_count >= total_q:
+            return jsonify({
+                'session_code': session_code,
+                'state': session_state(session_code, game_session),
+                'message': 'All questions already answered'
+            })
+        question_index = current_answer_count
+    
+    if question_index < current_answer_count:
+        # A retry of an answer that already landed: report success if it matches.
+        recorded = db.session.query(Answer.answer).filter_by(
+            session_code=session_code, student_number=student_number, question_index=question_index
+        ).scalar()
+        if recorded != answer:
+            return jsonify({'error': 'A different answer is already recorded for this question'}), 409
+        return jsonify({
+            'session_code': session_code,
+            'state': session_state(session_code, game_session),
+            'message': 'Answer already recorded'
+        })
+    
+    if question_index > current_answer_count:
+        return jsonify({'error': 'Answer the earlier questions first'}), 409
+
+    if current_answer_count >= len(game_session['questions']):
+        return jsonify({'error': 'Question not ready yet'}), 409
+    
+    inserted = db.session.execute(
+        sqlite_insert(Answer)
+        .values(
+            session_code=session_code,
+            student_number=student_number,
+            question_index=question_index,
+            answer=answer,
+            created_at=datetime.utcnow()
+        )
+        .on_conflict_do_nothing(index_elements=['session_code', 'student_number', 'question_index'])
+    ).rowcount
+    if not inserted:
+        # The same slot was written concurrently; the retry resolves it as a replay or a conflict.
+        raise VersionConflict(session_code)
+    answer_counts[student_number] += 1
+    advance_version(game_session_db)
+    
+    completed = everyone_answered(game_session_db, answer_counts) and game_session_db.status != 'completed'
+    leaderboard_changed = complete_session(game_session_db) if completed else False
     
-    game_session_db.student2_name = student_name
-    game_session_db.status = 'in_progress'
     db.session.commit()
     
-    if session_code not in active_sessions:
-        session_data = {
-            'student1': {
-                'name': game_session_db.student1_name,
-                'answers': game_session_db.get_student1_answers(),
-                'score': game_session_db.student1_score
-            },
-            'student2': {
-                'name': student_name,
-                'answers': game_session_db.get_student2_answers(),
-                'score': game_session_db.student2_score
-            },
-            'status': 'in_progress',
-            'current_question': game_session_db.current_question,
-            'questions': questions,
-            'created_at': game_session_db.created_at.isoformat() if game_session_db.created_at else datetime.now().isoformat()
-        }
-        active_sessions[session_code] = session_data
+    # The cached copy is only touched once the answer is committed, so a retried attempt never leaves it half-updated.
+    if completed:
+        refresh_session(game_session, game_session_db)
     else:
-        game_session = active_sessions[session_code]
-        game_session['student2']['name'] = student_name
-        game_session['status'] = 'in_progress'
+        participant = game_session['participants'][student_number - 1]
+        if len(participant['answers']) == current_answer_count:
+            participant['answers'].append(answer)
+        else:
+            participant['answers'] = game_session_db.get_answers()[student_number]
+        game_session['current_question'] = current_question_index(*answer_counts.values())
+        game_session['version'] = game_session_db.version
+    save_session(session_code, game_session)
+    if leaderboard_changed:
+        leaderboard_snapshot.invalidate()
 
-    game_session = active_sessions[session_code]
+    broadcast_session_event(session_code, 'answer_count', {
+        'student_number': student_number,
+        'answered': answer_counts[student_number]
+    })
+    if game_session['status'] == 'completed':
+        broadcast_completion(session_code, game_session)
+    
+    return jsonify({
+        'session_code': session_code,
+        'state': session_state(session_code, game_session)
+    })
 
-    if 'questions' not in game_session or len(game_session.get('questions', [])) == 0 or game_session.get('questions') == questions:
-        try:
-            regenerated = generate_questions(game_session['student1']['name'], student_name, count=10)
-            if isinstance(regenerated, list) and len(regenerated) >= 10:
-                game_session['questions'] = regenerated[:10]
-            else:
-                game_session['questions'] = questions[:10]
-        except Exception as e:
-            print(f"Error regenerating questions: {e}")
-            game_session['questions'] = questions[:10]
-    
-    if len(game_session.get('questions', [])) != 10:
-        game_session['questions'] = questions[:10]
+@app.route('/api/start_session', methods=['POST'])
+def start_session():
+    data = request.json
+    session_code = data.get('session_code')
+    student_number = data.get('student_number')
+    
+    if not session_code:
+        return jsonify({'error': 'Invalid session code'}), 404
+    
+    game_session_db = GameSession.query.filter_by(code=session_code).first()
+    if not game_session_db:
+        return jsonify({'error': 'Invalid session code'}), 404
+    
+    if student_number != 1:
+        return jsonify({'error': 'Only the player who created the room can start it'}), 403
+    
+    # Shrinking the room to the players already in it closes it to joins in the same statement.
+    started = db.session.execute(
+        update(GameSession)
+        .where(
+            GameSession.code == session_code,
+            GameSession.status != 'completed',
+            GameSession.participant_count >= 2
+        )
+        .values(max_participants=GameSession.participant_count, version=GameSession.version + 1)
+        .returning(GameSession.max_participants, GameSession.version)
+        .execution_options(synchronize_session=False)
+    ).first()
+    if started is None:
+        db.session.rollback()
+        return jsonify({'error': 'Session needs a second player and must not have finished'}), 400
+    
+    max_participants, version = started
+    set_committed_value(game_session_db, 'max_participants', max_participants)
+    set_committed_value(game_session_db, 'version', version)
+    
+    # Everyone who joined may already be done; the room could only complete once it closed.
+    completed = everyone_answered(game_session_db, game_session_db.answer_counts())
+    leaderboard_changed = complete_session(game_session_db) if completed else False
+    game_session = load_session(session_code, game_session_db, refresh=True)
+    db.session.commit()
+    
+    if leaderboard_changed:
+        leaderboard_snapshot.invalidate()
+    
+    broadcast_session_event(session_code, 'session_started', {
+        'max_participants': max_participants,
+        'status': game_session['status']
+    })
+    if completed:
+        broadcast_completion(session_code, game_session)
     
     return jsonify({
         'session_code': session_code,
-        'session_data': game_session
+        'state': session_state(session_code, game_session)
     })
 
 @app.route('/api/submit_answer', methods=['POST'])
@@ -184,202 +805,192 @@ def submit_answer():
     session_code = data.get('session_code')
     student_number = data.get('student_number')
     answer = data.get('answer')
+    question_index = data.get('question_index')
     
     if not session_code:
         return jsonify({'error': 'Invalid session code'}), 404
     
-    if student_number not in [1, 2]:
-        return jsonify({'error': 'Invalid student number'}), 400
-    
     if answer not in [1, 2]:
         return jsonify({'error': 'Invalid answer'}), 400
     
-    game_session_db = GameSession.query.filter_by(code=session_code).first()
-    if not game_session_db:
-        return jsonify({'error': 'Session not found in database'}), 404
+    if question_index is not None and (
+        not isinstance(question_index, int) or not 0 <= question_index < QUESTIONS_PER_SESSION
+    ):
+        return jsonify({'error': 'Invalid question index'}), 400
     
-    if session_code not in active_sessions:
-        session_questions = questions[:10]
-        if game_session_db.student2_name:
-            try:
-                generated = generate_questions(game_session_db.student1_name, game_session_db.student2_name, count=10)
-                if isinstance(generated, list) and len(generated) >= 10:
-                    session_questions = generated[:10]
-            except Exception:
-                pass
-        
-        session_data = {
-            'student1': {
-                'name': game_session_db.student1_name,
-                'answers': game_session_db.get_student1_answers(),
-                'score': game_session_db.student1_score
-            },
-            'student2': {
-                'name': game_session_db.student2_name or '',
-                'answers': game_session_db.get_student2_answers(),
-                'score': game_session_db.student2_score
-            },
-            'status': game_session_db.status,
-            'current_question': game_session_db.current_question,
-            'questions': session_questions,
-            'created_at': game_session_db.created_at.isoformat() if game_session_db.created_at else datetime.now().isoformat()
-        }
-        active_sessions[session_code] = session_data
-    else:
-        if 'questions' not in active_sessions[session_code] or len(active_sessions[session_code].get('questions', [])) != 10:
-            if game_session_db.student2_name:
-                try:
-                    generated = generate_questions(game_session_db.student1_name, game_session_db.student2_name, count=10)
-                    if isinstance(generated, list) and len(generated) >= 10:
-                        active_sessions[session_code]['questions'] = generated[:10]
-                    else:
-                        active_sessions[session_code]['questions'] = questions[:10]
-                except Exception:
-                    active_sessions[session_code]['questions'] = questions[:10]
-            else:
-                active_sessions[session_code]['questions'] = questions[:10]
-    
-    game_session = active_sessions[session_code]
-    
-    student_key = f'student{student_number}'
-    total_q = len(game_session.get('questions', questions))
-    current_answer_count = len(game_session[student_key]['answers'])
-    
-    if current_answer_count >= total_q:
-        return jsonify({
-            'session_code': session_code,
-            'session_data': game_session,
-            'message': 'All questions already answered'
-        })
+    for _ in range(SUBMIT_ATTEMPTS):
+        try:
+            return record_answer(session_code, student_number, answer, question_index)
+        except (VersionConflict, OperationalError) as error:
+            if isinstance(error, OperationalError) and 'locked' not in str(error):
+                raise
+            # Another write to this session committed first; start over from fresh state.
+            db.session.rollback()
+    response = jsonify({'error': 'Session is busy, please retry'})
+    response.headers['Retry-After'] = '1'
+    return response, 503
+
+@app.route('/api/get_session', methods=['GET'])
+def get_session():
+    session_code = request.args.get('session_code')
     
-    game_session[student_key]['answers'].append(answer)
+    if not session_code:
+        return jsonify({'error': 'Invalid session code'}), 404
     
-    if student_number == 1:
-        game_session_db.set_student1_answers(game_session['student1']['answers'])
-        game_session_db.current_question = max(game_session_db.current_question, current_answer_count)
-    else:
-        game_session_db.set_student2_answers(game_session['student2']['answers'])
-        game_session_db.current_question = max(game_session_db.current_question, current_answer_count)
-    
-    student1_complete = len(game_session['student1']['answers']) == total_q
-    student2_complete = len(game_session['student2']['answers']) == total_q
-    
-    if student1_complete and student2_complete and game_session_db.status != 'completed':
-        matching_answers = 0
-        for i in range(total_q):
-            if game_session['student1']['answers'][i] == game_session['student2']['answers'][i]:
-                matching_answers += 1
-        
-        score = matching_answers * 10
-        game_session['student1']['score'] = score
-        game_session['student2']['score'] = score
-        game_session['status'] = 'completed'
-        
-        game_session_db.student1_score = score
-        game_session_db.student2_score = score
-        game_session_db.status = 'completed'
-        
-        existing_entry = LeaderboardEntry.query.filter_by(
-            student1_name=game_session['student1']['name'],
-            student2_name=game_session['student2']['name']
-        ).first()
-        
-        if not existing_entry:
-            leaderboard_entry = LeaderboardEntry(
-                student1_name=game_session['student1']['name'],
-                student2_name=game_session['student2']['name'],
-                matching_answers=matching_answers,
-                score=score
-            )
-            db.session.add(leaderboard_entry)
+    game_session_db = GameSession.query.filter_by(code=session_code).first()
+    if not game_session_db:
+        return jsonify({'error': 'Session not found'}), 404
     
+    game_session = load_session(session_code, game_session_db, refresh=True)
     db.session.commit()
     
-    return jsonify({
-        'session_code': session_code,
-        'session_data': game_session
-    })
+    return jsonify(dict(game_session, **student_aliases(game_session)))
 
-@app.route('/api/get_session', methods=['GET'])
-def get_session():
+@app.route('/api/session_state', methods=['GET'])
+def get_session_state():
     session_code = request.args.get('session_code')
+    since = request.args.get('since', type=int)
     
     if not session_code:
         return jsonify({'error': 'Invalid session code'}), 404
     
-    game_session_db = GameSession.query.filter_by(code=session_code).first()
+    version = db.session.query(GameSession.version).filter_by(code=session_code).scalar()
+    if version is None:
+        return jsonify({'error': 'Session not found'}), 404
+    
+    etag = f'{session_code}-{version}'
+    if since == version or etag in request.if_none_match:
+        response = app.response_class(status=304)
+        response.set_etag(etag)
+        return response
+    
+    game_session = active_sessions.get(session_code)
+    if game_session is None or game_session.get('version') != version:
+        game_session_db = db.session.get(GameSession, session_code)
+        game_session = load_session(session_code, game_session_db, refresh=True)
+        db.session.commit()
+    
+    response = jsonify(session_state(session_code, game_session))
+    response.set_etag(f"{session_code}-{game_session['version']}")
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+@app.route('/api/sessions/<session_code>/questions/<key>', methods=['GET'])
+def get_session_questions(session_code, key):
+    game_session_db = db.session.get(GameSession, session_code)
     if not game_session_db:
         return jsonify({'error': 'Session not found'}), 404
     
-    if session_code not in active_sessions:
-        session_questions = questions[:10]
-        if game_session_db.student2_name:
-            try:
-                generated = generate_questions(game_session_db.student1_name, game_session_db.student2_name, count=10)
-                if isinstance(generated, list) and len(generated) >= 10:
-                    session_questions = generated[:10]
-            except Exception:
-                pass
-        
-        session_data = {
-            'student1': {
-                'name': game_session_db.student1_name,
-                'answers': game_session_db.get_student1_answers(),
-                'score': game_session_db.student1_score
-            },
-            'student2': {
-                'name': game_session_db.student2_name or '',
-                'answers': game_session_db.get_student2_answers(),
-                'score': game_session_db.student2_score
-            },
-            'status': game_session_db.status,
-            'current_question': game_session_db.current_question,
-            'questions': session_questions,
-            'created_at': game_session_db.created_at.isoformat() if game_session_db.created_at else datetime.now().isoformat()
-        }
-        active_sessions[session_code] = session_data
-    else:
-        game_session = active_sessions[session_code]
-        game_session['student1']['answers'] = game_session_db.get_student1_answers()
-        game_session['student2']['answers'] = game_session_db.get_student2_answers()
-        game_session['student1']['score'] = game_session_db.student1_score
-        game_session['student2']['score'] = game_session_db.student2_score
-        game_session['status'] = game_session_db.status
-        game_session['current_question'] = game_session_db.current_question
-        
-        if 'questions' not in game_session or len(game_session.get('questions', [])) != 10:
-            if game_session_db.student2_name:
-                try:
-                    generated = generate_questions(game_session_db.student1_name, game_session_db.student2_name, count=10)
-                    if isinstance(generated, list) and len(generated) >= 10:
-                        game_session['questions'] = generated[:10]
-                    else:
-                        game_session['questions'] = questions[:10]
-                except Exception:
-                    game_session['questions'] = questions[:10]
-            else:
-                game_session['questions'] = questions[:10]
-    
-    return jsonify(active_sessions[session_code])
+    game_session = load_session(session_code, game_session_db)
+    db.session.commit()
+    if game_session['questions_key'] != key:
+        return jsonify({
+            'error': 'Question set has changed',
+            'questions_url': url_for('get_session_questions', session_code=session_code, key=game_session['questions_key'])
+        }), 404
+    
+    # The key is a hash of the set, so a given URL always returns the same questions.
+    response = jsonify({'questions': game_session['questions'], 'total_questions': QUESTIONS_PER_SESSION})
+    response.set_etag(key)
+    response.headers['Cache-Control'] = 'public, max-age=31536000, immutable'
+    return response
+
+@app.route('/api/status', methods=['GET'])
+def get_status():
+    return jsonify({
+        'question_pool': question_pool.stats(),
+        'llm': get_llm_stats(),
+        'session_store': active_sessions.stats(),
+        'session_codes': code_allocator.stats(),
+        'question_pack': question_pack_store.stats() if question_pack_store is not None else None,
+        'maintenance': maintenance_task.stats()
+    })
+
+metrics.registry.collected(
+    'know_zone_active_sessions', 'Sessions held in the session store', lambda: len(active_sessions),
+)
+metrics.registry.collected(
+    'know_zone_session_store_lookups_total', 'Session store lookups by result',
+    lambda: {result: active_sessions.stats()[result] for result in ('hits', 'misses')}, ('result',), kind='counter',
+)
+metrics.registry.collected(
+    'know_zone_question_pool_depth', 'Question sets ready in the pool', lambda: question_pool.stats()['depth'],
+)
+metrics.registry.collected(
+    'know_zone_llm_events_total', 'LLM completion outcomes, fallbacks and parse failures',
+    lambda: {name: value for name, value in get_llm_stats().items() if isinstance(value, int)}, ('event',),
+    kind='counter',
+)
+metrics.registry.collected(
+    'know_zone_llm_breaker_open', '1 while the LLM circuit breaker is open',
+    lambda: int(get_llm_stats()['breaker']['state'] == 'open'),
+)
+
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    return app.response_class(metrics.registry.render(), content_type=metrics.CONTENT_TYPE)
+
+@app.route('/api/stats', methods=['GET'])
+def get_stats():
+    days = request.args.get('days', default=STATS_DEFAULT_DAYS, type=int)
+    limit = request.args.get('limit', default=STATS_DEFAULT_LIMIT, type=int)
+    if not 1 <= days <= STATS_MAX_DAYS:
+        return jsonify({'error': f'days must be between 1 and {STATS_MAX_DAYS}'}), 400
+    if not 1 <= limit <= STATS_MAX_LIMIT:
+        return jsonify({'error': f'limit must be between 1 and {STATS_MAX_LIMIT}'}), 400
+    
+    return jsonify({
+        'days': stats.recent_days(days),
+        'most_divisive_questions': stats.top_questions('divisive', limit, min_pairs=1)
+    })
+
+@app.route('/api/stats/questions', methods=['GET'])
+def get_question_stats():
+    sort = request.args.get('sort', 'divisive')
+    limit = request.args.get('limit', default=STATS_DEFAULT_LIMIT, type=int)
+    min_pairs = request.args.get('min_pairs', default=0, type=int)
+    if sort not in stats.QUESTION_SORTS:
+        return jsonify({'error': f"sort must be one of {', '.join(stats.QUESTION_SORTS)}"}), 400
+    if not 1 <= limit <= STATS_MAX_LIMIT:
+        return jsonify({'error': f'limit must be between 1 and {STATS_MAX_LIMIT}'}), 400
+    
+    return jsonify(stats.top_questions(sort, limit, min_pairs=max(0, min_pairs)))
+
+@app.route('/api/stats/questions/<int:question_id>', methods=['GET'])
+def get_single_question_stats(question_id):
+    question_stats = stats.question(question_id)
+    if question_stats is None:
+        return jsonify({'error': 'No answers recorded for this question'}), 404
+    return jsonify(question_stats)
 
 @app.route('/api/get_leaderboard', methods=['GET'])
 def get_leaderboard():
-    entries = LeaderboardEntry.query.order_by(LeaderboardEntry.score.desc()).all()
-    
-    leaderboard_data = []
-    for entry in entries:
-        leaderboard_data.append({
-            'student1': entry.student1_name,
-            'student2': entry.student2_name,
-            'matching_answers': entry.matching_answers,
-            'score': entry.score,
-            'date': entry.date.strftime('%m/%d/%Y')
-        })
+    limit = request.args.get('limit', default=LEADERBOARD_DEFAULT_LIMIT, type=int)
+    cursor = request.args.get('cursor')
+    
+    if not 1 <= limit <= LEADERBOARD_MAX_LIMIT:
+        return jsonify({'error': f'limit must be between 1 and {LEADERBOARD_MAX_LIMIT}'}), 400
     
-    return jsonify(leaderboard_data)
+    try:
+        if not cursor and limit <= leaderboard_snapshot.size:
+            leaderboard_data, next_cursor = leaderboard_snapshot.page(limit)
+        else:
+            leaderboard_data, next_cursor = leaderboard.fetch_page(limit, cursor)
+    except ValueError:
+        return jsonify({'error': 'Invalid cursor'}), 400
+    
+    response = jsonify(leaderboard_data)
+    if next_cursor:
+        response.headers['X-Next-Cursor'] = next_cursor
+    digest = hashlib.sha1(response.get_data())
+    digest.update((next_cursor or '').encode('ascii'))
+    response.set_etag(digest.hexdigest())
+    response.headers['Cache-Control'] = 'no-cache'
+    return response.make_conditional(request)
 
 if __name__ == '__main__':
-    with app.app_context():
-        db.create_all()
+    create_app()
+    question_pool.start()
+    maintenance_task.start()
     
-    app.run(debug=True, host='0.0.0.0', port=5000)
+    socketio.run(app, debug=True, host='0.0.0.0', port=5000)
@@ -0,0 +1,145 @@
+import argparse
+import itertools
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """Answers OpenAI-style chat completion requests with generated questions.
+
+    Each response waits ``server.latency`` seconds; ``server.failure_rate`` of
+    requests fail with a 503 so retries and the circuit breaker get exercised.
+    Streamed requests are also counted on their own, with the most that were open at once.
+    """
+
+    protocol_version = 'HTTP/1.1'
+    _count_pattern = re.compile(r'Create (\d+)')
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+        stream = bool(body.get('stream'))
+        self.server.record_request(stream)
+        try:
+            self._respond(body, stream)
+        finally:
+            if stream:
+                self.server.end_stream()
+
+    def _respond(self, body, stream):
+        time.sleep(self.server.latency)
+        if random.random() < self.server.failure_rate:
+            self._send_json(503, {'error': {'message': 'stub failure', 'type': 'server_error'}})
+            return
+
+        prompt = body.get('messages', [{}])[-1].get('content', '')
+        match = self._count_pattern.search(prompt)
+        items = self.server.make_questions(int(match.group(1)) if match else 10)
+        content = json.dumps(items)
+        if stream:
+            self._send_stream(content)
+        else:
+            self._send_json(200, {
+                'id': 'stub', 'object': 'chat.completion', 'created': int(time.time()), 'model': body.get('model', 'stub'),
+                'choices': [{'index': 0, 'finish_reason': 'stop', 'message': {'role': 'assistant', 'content': content}}],
+            })
+
+    def _send_json(self, status, payload):
+        data = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _send_stream(self, content, chunk_size=40):
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        for start in range(0, len(content), chunk_size):
+            chunk = {
+                'id': 'stub', 'object': 'chat.completion.chunk', 'created': int(time.time()), 'model': 'stub',
+                'choices': [{'index': 0, 'delta': {'content': content[start:start + chunk_size]}, 'finish_reason': None}],
+            }
+            self._write_chunk(f'data: {json.dumps(chunk)}\n\n')
+        self._write_chunk('data: [DONE]\n\n')
+        self.wfile.write(b'0\r\n\r\n')
+
+    def _write_chunk(self, text):
+        data = text.encode('utf-8')
+        self.wfile.write(b'%x\r\n%s\r\n' % (len(data), data))
+        self.wfile.flush()
+
+
+class StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, latency=0.0, failure_rate=0.0):
+        super().__init__(address, StubHandler)
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.requests = 0
+        self.streamed_requests = 0
+        self.max_open_streams = 0
+        self._open_streams = 0
+        self._serial = itertools.count()
+        self._lock = threading.Lock()
+
+    @property
+    def base_url(self):
+        host, port = self.server_address[:2]
+        return f'http://{host}:{port}/v1'
+
+    def record_request(self, stream=False):
+        with self._lock:
+            self.requests += 1
+            if stream:
+                self.streamed_requests += 1
+                self._open_streams += 1
+                self.max_open_streams = max(self.max_open_streams, self._open_streams)
+
+    def end_stream(self):
+        with self._lock:
+            self._open_streams -= 1
+
+    def make_questions(self, count):
+        with self._lock:
+            serials = [next(self._serial) for _ in range(count)]
+        return [
+            {'question': 'Would you rather...', 'option1': f'Cite source {n}', 'option2': f'Paraphrase source {n}'}
+            for n in serials
+        ]
+
+
+def start_stub(latency=0.0, failure_rate=0.0, host='127.0.0.1', port=0):
+    """Start a stub server on a background thread and return it; ``port=0`` picks a free port."""
+    server = StubServer((host, port), latency=latency, failure_rate=failure_rate)
+    threading.Thread(target=server.serve_forever, name='llm-stub', daemon=True).start()
+    return server
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Local stand-in for the OpenRouter chat completions API')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--latency', type=float, default=0.5, help='Seconds before each response')
+    parser.add_argument('--failure-rate', type=float, default=0.0, help='Fraction of requests answered with 503')
+    args = parser.parse_args(argv)
+
+    server = StubServer((args.host, args.port), latency=args.latency, failure_rate=args.failure_rate)
+    print(f'Set OPENROUTER_BASE_URL={server.base_url}')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
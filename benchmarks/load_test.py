@@ -0,0 +1,329 @@
+import argparse
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.llm_stub import start_stub
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+
+
+class Recorder:
+    """Collects latency, status and SQL statement count for every request made by the harness."""
+
+    def __init__(self):
+        self.samples = defaultdict(list)
+        self.statuses = defaultdict(Counter)
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    def count_query(self, *args, **kwargs):
+        if getattr(self._local, 'queries', None) is not None:
+            self._local.queries += 1
+
+    def call(self, endpoint, send):
+        # The test client runs the request on the calling thread, so a
+        # thread-local counter sees exactly the statements of this request.
+        self._local.queries = 0
+        started = time.perf_counter()
+        try:
+            response = send()
+        finally:
+            elapsed = time.perf_counter() - started
+            queries, self._local.queries = self._local.queries, None
+        with self._lock:
+            self.samples[endpoint].append((elapsed, queries))
+            self.statuses[endpoint][response.status_code] += 1
+        return response
+
+    def request_count(self):
+        return sum(len(samples) for samples in self.samples.values())
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, int(round(fraction * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[index]
+
+
+def summarise(recorder):
+    endpoints = {}
+    for endpoint, samples in sorted(recorder.samples.items()):
+        latencies = sorted(elapsed * 1000 for elapsed, _ in samples)
+        queries = [count for _, count in samples]
+        endpoints[endpoint] = {
+            'count': len(samples),
+            'mean_ms': round(sum(latencies) / len(latencies), 3),
+            'p50_ms': round(percentile(latencies, 0.50), 3),
+            'p95_ms': round(percentile(latencies, 0.95), 3),
+            'p99_ms': round(percentile(latencies, 0.99), 3),
+            'queries_per_request': round(sum(queries) / len(queries), 2),
+            'max_queries': max(queries),
+            'statuses': {str(status): count for status, count in sorted(recorder.statuses[endpoint].items())},
+        }
+    return endpoints
+
+
+def _deep_sizeof(value, seen=None):
+    seen = set() if seen is None else seen
+    if id(value) in seen:
+        return 0
+    seen.add(id(value))
+    size = sys.getsizeof(value)
+    if isinstance(value, dict):
+        size += sum(_deep_sizeof(k, seen) + _deep_sizeof(v, seen) for k, v in value.items())
+    elif isinstance(value, (list, tuple, set)):
+        size += sum(_deep_sizeof(item, seen) for item in value)
+    return size
+
+
+def store_footprint(store):
+    entries = getattr(store, '_entries', None)
+    if entries is not None:
+        with store._lock:
+            snapshot = list(entries.values())
+        return len(snapshot), _deep_sizeof(snapshot)
+    path = getattr(store, 'path', None)
+    size = sum(os.path.getsize(p) for p in (path, f'{path}-wal') if p and os.path.exists(p))
+    return len(store), size
+
+
+class Player:
+    def __init__(self, client, recorder, number):
+        self.client = client
+        self.recorder = recorder
+        self.number = number
+        self.state = None
+
+    def post(self, endpoint, path, payload):
+        return self.recorder.call(endpoint, lambda: self.client.post(path, json=payload))
+
+    def get(self, endpoint, path):
+        return self.recorder.call(endpoint, lambda: self.client.get(path))
+
+    def apply(self, response):
+        if response.status_code == 200:
+            self.state = response.get_json().get('state', self.state)
+        return response
+
+    def poll(self):
+        code = self.state['session_code']
+        response = self.get('session_state', f"/api/session_state?session_code={code}&since={self.state['version']}")
+        if response.status_code == 200:
+            self.state = response.get_json()
+        return response
+
+    def answer(self, retries=200, wait=0.02):
+        code = self.state['session_code']
+        question_index = len(self.state['participants'][self.number - 1]['answers'])
+        choice = random.choice((1, 2))
+        for _ in range(retries):
+            response = self.post('submit_answer', '/api/submit_answer', {
+                'session_code': code,
+                'student_number': self.number,
+                'question_index': question_index,
+                'answer': choice,
+            })
+            busy = response.status_code == 503
+            not_ready = response.status_code == 409 and response.get_json().get('error') == 'Question not ready yet'
+            if not busy and not not_ready:
+                return self.apply(response)
+            # The question is still streaming in from the LLM, or another write won the race.
+            time.sleep(wait)
+            self.poll()
+        return response
+
+
+def play_pair(app, recorder, pair_index, polls_per_answer):
+    creator = Player(app.test_client(), recorder, 1)
+    joiner = Player(app.test_client(), recorder, 2)
+
+    response = creator.apply(creator.post('create_session', '/api/create_session', {'name': f'Bench A{pair_index}'}))
+    if response.status_code != 200:
+        return False
+    code = creator.state['session_code']
+    response = joiner.apply(joiner.post('join_session', '/api/join_session', {'session_code': code, 'name': f'Bench B{pair_index}'}))
+    if response.status_code != 200:
+        return False
+    creator.poll()
+    for player in (creator, joiner):
+        player.get('session_questions', player.state['questions_url'])
+
+    for _ in range(creator.state['total_questions']):
+        for player in (creator, joiner):
+            for _ in range(polls_per_answer):
+                player.poll()
+            player.answer()
+
+    joiner.poll()
+    creator.get('get_leaderboard', '/api/get_leaderboard')
+    return joiner.state['status'] == 'completed'
+
+
+def run(args):
+    workdir = tempfile.mkdtemp(prefix='know-zone-bench-')
+    stub = start_stub(latency=args.llm_latency, failure_rate=args.llm_failure_rate)
+    os.environ.update({
+        'OPENROUTER_API_KEY': 'benchmark',
+        'OPENROUTER_BASE_URL': stub.base_url,
+        'DATABASE_URL': 'sqlite:///' + os.path.join(workdir, 'benchmark.db'),
+        'SESSION_STORE_PATH': os.path.join(workdir, 'sessions.db'),
+    })
+
+    from sqlalchemy import event
+    from app import QUESTION_STREAM_LIMIT, active_sessions, create_app, db, question_pool
+
+    app = create_app()
+    recorder = Recorder()
+    with app.app_context():
+        event.listen(db.engine, 'before_cursor_execute', recorder.count_query)
+    question_pool.start()
+
+    for pair_index in range(args.warmup):
+        play_pair(app, Recorder(), -1 - pair_index, args.polls_per_answer)
+
+    entries_before, bytes_before = store_footprint(active_sessions)
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        results = list(executor.map(
+            lambda index: play_pair(app, recorder, index, args.polls_per_answer),
+            range(args.pairs),
+        ))
+    duration = time.perf_counter() - started
+    entries_after, bytes_after = store_footprint(active_sessions)
+    question_pool.stop()
+    with app.app_context():
+        db.engine.dispose()
+    shutil.rmtree(workdir, ignore_errors=True)
+
+    completed = sum(results)
+    return {
+        'config': {
+            'pairs': args.pairs,
+            'concurrency': args.concurrency,
+            'polls_per_answer': args.polls_per_answer,
+            'llm_latency': args.llm_latency,
+            'llm_failure_rate': args.llm_failure_rate,
+            'session_store': active_sessions.backend,
+            'question_stream_limit': QUESTION_STREAM_LIMIT,
+        },
+        'duration_seconds': round(duration, 3),
+        'games_completed': completed,
+        'games_per_second': round(completed / duration, 2),
+        'requests_per_second': round(recorder.request_count() / duration, 1),
+        'endpoints': summarise(recorder),
+        'session_store': {
+            'entries_before': entries_before,
+            'entries_after': entries_after,
+            'bytes_before': bytes_before,
+            'bytes_after': bytes_after,
+            'bytes_per_session': round((bytes_after - bytes_before) / max(1, entries_after - entries_before)),
+        },
+        'llm_requests': stub.requests,
+        'llm_streamed_requests': stub.streamed_requests,
+        'llm_max_open_streams': stub.max_open_streams,
+    }
+
+
+def check_llm(report, max_requests=None):
+    """Return a list of problems with the LLM traffic in ``report``.
+
+    Non-streamed requests go through the batch coalescer; streams each cost a
+    completion of their own, so more of them open at once than the app's limit
+    means a burst of pool misses is no longer capped.
+    """
+    problems = []
+    limit = report['config']['question_stream_limit']
+    if report['llm_max_open_streams'] > limit:
+        problems.append(f"{report['llm_max_open_streams']} streamed completions were open at once (limit {limit})")
+    if max_requests is not None and report['llm_requests'] > max_requests:
+        problems.append(f"{report['llm_requests']} LLM requests (limit {max_requests})")
+    return problems
+
+
+def compare(report, baseline, tolerance, noise_ms=2.0):
+    """Return a list of regressions of ``report`` against ``baseline``."""
+    regressions = []
+    for endpoint, expected in baseline['endpoints'].items():
+        actual = report['endpoints'].get(endpoint)
+        if actual is None:
+            continue
+        for key in ('p50_ms', 'p95_ms'):
+            limit = expected[key] * (1 + tolerance) + noise_ms
+            if actual[key] > limit:
+                regressions.append(f'{endpoint} {key}: {actual[key]} > {round(limit, 3)} (baseline {expected[key]})')
+        if actual['queries_per_request'] > expected['queries_per_request'] + 0.5:
+            regressions.append(
+                f"{endpoint} queries_per_request: {actual['queries_per_request']} "
+                f"(baseline {expected['queries_per_request']})"
+            )
+    return regressions
+
+
+def print_report(report):
+    print(f"{report['games_completed']}/{report['config']['pairs']} games in {report['duration_seconds']}s: "
+          f"{report['games_per_second']} games/s, {report['requests_per_second']} requests/s")
+    print(f"{'endpoint':<20}{'count':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'queries':>9}  statuses")
+    for endpoint, stats in report['endpoints'].items():
+        print(f"{endpoint:<20}{stats['count']:>8}{stats['p50_ms']:>10}{stats['p95_ms']:>10}{stats['p99_ms']:>10}"
+              f"{stats['queries_per_request']:>9}  {stats['statuses']}")
+    store = report['session_store']
+    print(f"session store: {store['entries_before']} -> {store['entries_after']} entries, "
+          f"{store['bytes_before']} -> {store['bytes_after']} bytes ({store['bytes_per_session']} per session)")
+    print(f"LLM stub requests: {report['llm_requests']} "
+          f"({report['llm_streamed_requests']} streamed, at most {report['llm_max_open_streams']} at once)")
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description='Simulate pairs of players against the game API')
+    parser.add_argument('--pairs', type=int, default=100, help='Games to play')
+    parser.add_argument('--concurrency', type=int, default=10, help='Games played at the same time')
+    parser.add_argument('--polls-per-answer', type=int, default=1, help='State polls before each answer')
+    parser.add_argument('--warmup', type=int, default=3, help='Unrecorded games played first')
+    parser.add_argument('--llm-latency', type=float, default=0.2, help='Seconds the LLM stub takes per request')
+    parser.add_argument('--llm-failure-rate', type=float, default=0.0, help='Fraction of LLM requests that fail')
+    parser.add_argument('--output', help='Write the JSON report to this file')
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE, help='Baseline report to save or compare against')
+    parser.add_argument('--save-baseline', action='store_true', help='Store this run as the baseline')
+    parser.add_argument('--compare', action='store_true', help='Exit with status 1 when slower than the baseline')
+    parser.add_argument('--tolerance', type=float, default=0.5, help='Allowed relative latency increase')
+    parser.add_argument('--max-llm-requests', type=int, help='Exit with status 1 when the LLM stub gets more requests')
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    report = run(args)
+    print_report(report)
+    problems = check_llm(report, args.max_llm_requests)
+    for problem in problems:
+        print(f'LLM {problem}')
+
+    if args.output:
+        with open(args.output, 'w') as handle:
+            json.dump(report, handle, indent=2)
+    if args.save_baseline:
+        with open(args.baseline, 'w') as handle:
+            json.dump(report, handle, indent=2)
+        print(f'Baseline saved to {args.baseline}')
+    if args.compare:
+        with open(args.baseline) as handle:
+            regressions = compare(report, json.load(handle), args.tolerance)
+        for regression in regressions:
+            print(f'REGRESSION {regression}')
+        if regressions:
+            return 1
+        print('No regressions against the baseline')
+    return 1 if problems else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
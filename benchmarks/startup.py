@@ -0,0 +1,112 @@
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Runs in a fresh interpreter so every import is cold, as in a newly spawned worker.
+CHILD = """
+import json, sys, time
+started = time.perf_counter()
+import app
+imported = time.perf_counter()
+app.create_app()
+initialised = time.perf_counter()
+response = app.app.test_client().get('/api/get_leaderboard')
+finished = time.perf_counter()
+print(json.dumps({
+    'import_ms': (imported - started) * 1000,
+    'init_ms': (initialised - imported) * 1000,
+    'first_request_ms': (finished - initialised) * 1000,
+    'status': response.status_code,
+    'openai_imported': 'openai' in sys.modules,
+    'numpy_imported': 'numpy' in sys.modules,
+}))
+"""
+
+PHASES = ('import_ms', 'init_ms', 'first_request_ms', 'total_ms', 'process_ms')
+
+
+def run_child(env):
+    started = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, '-c', CHILD], cwd=ROOT, env=env, capture_output=True, text=True, check=True,
+    )
+    sample = json.loads(result.stdout.strip().splitlines()[-1])
+    sample['total_ms'] = sample['import_ms'] + sample['init_ms'] + sample['first_request_ms']
+    sample['process_ms'] = (time.perf_counter() - started) * 1000
+    return sample
+
+
+def run(args):
+    workdir = tempfile.mkdtemp(prefix='know-zone-startup-')
+    env = {key: value for key, value in os.environ.items() if key not in ('OPENROUTER_API_KEY', 'OPENAI_API_KEY')}
+    env.update({
+        'DATABASE_URL': 'sqlite:///' + os.path.join(workdir, 'startup.db'),
+        'SESSION_STORE_PATH': os.path.join(workdir, 'sessions.db'),
+        # An empty key overrides a .env file, which load_dotenv never replaces.
+        'OPENROUTER_API_KEY': '',
+        'OPENAI_API_KEY': '',
+    })
+    try:
+        fresh = run_child(env)
+        samples = [run_child(env) for _ in range(args.runs)]
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    return {
+        'runs': args.runs,
+        'fresh_database': {phase: round(fresh[phase], 1) for phase in PHASES},
+        'median': {phase: round(statistics.median(s[phase] for s in samples), 1) for phase in PHASES},
+        'max': {phase: round(max(s[phase] for s in samples), 1) for phase in PHASES},
+        'statuses': sorted({s['status'] for s in samples + [fresh]}),
+        'openai_imported': any(s['openai_imported'] for s in samples + [fresh]),
+        'numpy_imported': any(s['numpy_imported'] for s in samples + [fresh]),
+    }
+
+
+def check(report, budget_ms):
+    """Return a list of problems with ``report``."""
+    problems = []
+    if report['median']['total_ms'] > budget_ms:
+        problems.append(f"import + init + first request took {report['median']['total_ms']} ms (budget {budget_ms} ms)")
+    if report['openai_imported']:
+        problems.append('the openai SDK was imported without an API key')
+    if report['numpy_imported']:
+        problems.append('NumPy was imported before any game was scored')
+    if report['statuses'] != [200]:
+        problems.append(f"first request returned {report['statuses']}")
+    return problems
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Measure cold import, initialisation and first-request latency')
+    parser.add_argument('--runs', type=int, default=5, help='Worker starts measured against an existing database')
+    parser.add_argument('--budget-ms', type=float, default=float(os.getenv('STARTUP_BUDGET_MS', '1000')),
+                        help='Allowed median of import + init + first request')
+    parser.add_argument('--json', action='store_true', help='Print the report as JSON')
+    args = parser.parse_args(argv)
+
+    report = run(args)
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print(f"{'':<16}" + ''.join(f'{phase:>18}' for phase in PHASES))
+        for label in ('fresh_database', 'median', 'max'):
+            print(f'{label:<16}' + ''.join(f'{report[label][phase]:>18}' for phase in PHASES))
+    problems = check(report, args.budget_ms)
+    for problem in problems:
+        print(f'OVER BUDGET {problem}')
+    if problems:
+        return 1
+    print(f'Within the {args.budget_ms:g} ms startup budget')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,13 @@
+# The academic-integrity set every session starts from when nothing fresher is ready.
+questions = [
+    {"question": "Would you rather...", "option1": "Copy someone else's homework the morning it's due", "option2": "Pay someone to write your final paper"},
+    {"question": "Would you rather...", "option1": "Take an exam you didn't study for honestly", "option2": "Cheat but risk getting caught and failing the course"},
+    {"question": "Would you rather...", "option1": "Work with a friend on an assignment meant to be individual", "option2": "Turn in an assignment late and lose points"},
+    {"question": "Would you rather...", "option1": "Use ChatGPT to write your entire essay", "option2": "Submit a poorly written essay you actually wrote"},
+    {"question": "Would you rather...", "option1": "Let a classmate copy your work knowing they'll keep doing it", "option2": "Refuse to share and risk the friendship"},
+    {"question": "Would you rather...", "option1": "Take credit for a group project you barely contributed to", "option2": "Tell the professor you didn't do your fair share"},
+    {"question": "Would you rather...", "option1": "Use a fake excuse to get an extension", "option2": "Submit incomplete work on time"},
+    {"question": "Would you rather...", "option1": "Have your professor discover you plagiarized", "option2": "Never get caught but always know you cheated"},
+    {"question": "Would you rather...", "option1": "Share test questions with friends after taking an exam", "option2": "Keep them to yourself knowing others might fail"},
+    {"question": "Would you rather...", "option1": "Get an A by cheating in one important course", "option2": "Get a B by being honest in all your courses"}
+]
@@ -0,0 +1,243 @@
+import argparse
+import json
+import os
+import signal
+import sys
+import threading
+import time
+
+
+class RequestTracker:
+    """WSGI middleware that counts in-flight HTTP requests and refuses new ones while draining.
+
+    Socket.IO traffic is passed through untouched: long-polling and websocket
+    connections stay open indefinitely and clients reconnect on their own.
+    """
+
+    def __init__(self, wsgi_app, socketio_path='/socket.io'):
+        self.wsgi_app = wsgi_app
+        self.socketio_path = socketio_path
+        self.draining = False
+        self.in_flight = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, environ, start_response):
+        if environ.get('PATH_INFO', '').startswith(self.socketio_path):
+            return self.wsgi_app(environ, start_response)
+        if self.draining:
+            start_response('503 Service Unavailable', [('Content-Type', 'text/plain'), ('Retry-After', '5')])
+            return [b'Server is shutting down']
+        with self._lock:
+            self.in_flight += 1
+        try:
+            # Responses are small JSON bodies; consume them here so the request
+            # counts as finished only once it has been fully produced.
+            result = self.wsgi_app(environ, start_response)
+            try:
+                return list(result)
+            finally:
+                if hasattr(result, 'close'):
+                    result.close()
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+
+
+def _env_int(name, default):
+    return int(os.getenv(name, str(default)))
+
+
+def serve(args):
+    if args.workers > 1:
+        return _serve_gunicorn(args)
+
+    import eventlet
+    eventlet.monkey_patch()
+    import eventlet.event
+    import eventlet.wsgi
+
+    from app import create_app, db, maintenance_task, question_pool
+
+    app = create_app()
+    question_pool.start()
+    maintenance_task.start()
+
+    tracker = RequestTracker(app.wsgi_app)
+    app.wsgi_app = tracker
+    listener = eventlet.listen((args.host, args.port))
+    server = eventlet.spawn(eventlet.wsgi.server, listener, app, log_output=args.access_log)
+    stopped = eventlet.event.Event()
+
+    def shutdown():
+        tracker.draining = True
+        deadline = time.monotonic() + args.graceful_timeout
+        while tracker.in_flight and time.monotonic() < deadline:
+            eventlet.sleep(0.05)
+        if tracker.in_flight:
+            print(f'Graceful timeout reached with {tracker.in_flight} request(s) still running', file=sys.stderr)
+        question_pool.stop()
+        maintenance_task.stop()
+        with app.app_context():
+            db.session.remove()
+            db.engine.dispose()
+        stopped.send()
+
+    def handle_signal(signum, frame):
+        if not tracker.draining:
+            print(f'Received signal {signum}, draining in-flight requests', file=sys.stderr)
+            eventlet.spawn_n(shutdown)
+
+    signal.signal(signal.SIGTERM, handle_signal)
+    signal.signal(signal.SIGINT, handle_signal)
+
+    print(f'Serving Know-Zone on http://{args.host}:{args.port}', file=sys.stderr)
+    stopped.wait()
+    server.kill()
+    return 0
+
+
+def _serve_gunicorn(args):
+    from app import init_database
+
+    if not os.getenv('SOCKETIO_MESSAGE_QUEUE'):
+        print('Warning: several workers without SOCKETIO_MESSAGE_QUEUE; realtime events only reach '
+              'clients connected to the same worker.', file=sys.stderr)
+    if os.getenv('SESSION_STORE', 'memory') == 'memory':
+        print('Warning: SESSION_STORE=memory keeps a separate cache per worker; '
+              'consider SESSION_STORE=sqlite.', file=sys.stderr)
+
+    # Bring the schema up to date before forking so workers start without migrating.
+    init_database()
+
+    command = [
+        sys.executable, '-m', 'gunicorn',
+        '--worker-class', 'eventlet',
+        '--workers', str(args.workers),
+        '--bind', f'{args.host}:{args.port}',
+        '--graceful-timeout', str(args.graceful_timeout),
+    ]
+    if args.access_log:
+        command += ['--access-logfile', '-']
+    command.append('app:create_app()')
+    os.execv(sys.executable, command)
+
+
+def run_maintenance(args):
+    from app import init_database, run_maintenance
+
+    init_database()
+    report = run_maintenance(full_vacuum=args.full_vacuum)
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return 0
+    for key, value in report.items():
+        print(f"{key.replace('_', ' ')}: {value}")
+    if report['vacuum'] == 'needs full vacuum':
+        print('Run once with --full-vacuum to enable incremental vacuum on this database', file=sys.stderr)
+    return 0
+
+
+def backfill_stats(args):
+    from app import app, db, init_database
+    import stats
+
+    init_database()
+    with app.app_context():
+        recorded = stats.backfill(batch_size=args.batch_size)
+        db.session.remove()
+    print(f'Added {recorded} completed game(s) to the stats')
+    return 0
+
+
+def compile_question_pack(args):
+    import question_pack
+
+    items = []
+    for path in args.sources:
+        items.extend(question_pack.read_source(path, args.topic))
+    if args.builtin:
+        from builtin_questions import questions
+        from open_ai.ai import DEFAULT_QUESTIONS
+
+        items.extend(dict(item, topic='academic integrity') for item in questions)
+        items.extend(dict(item, topic='school') for item in DEFAULT_QUESTIONS)
+    if args.generate:
+        if not (os.getenv('OPENROUTER_API_KEY') or os.getenv('OPENAI_API_KEY')):
+            print('--generate needs OPENROUTER_API_KEY or OPENAI_API_KEY', file=sys.stderr)
+            return 2
+        from open_ai.ai import request_questions
+
+        for topic in args.generate_topic or [args.topic]:
+            generated = []
+            # Stop after a few rounds that fail or add nothing new rather than padding with fallbacks.
+            for _ in range(max(1, args.generate // 10) * 3):
+                if len(generated) >= args.generate:
+                    break
+                batch = request_questions(count=min(50, args.generate - len(generated)), topic=topic)
+                generated.extend(item for item in batch if item not in generated)
+            if len(generated) < args.generate:
+                print(f'{topic}: generated {len(generated)} of {args.generate} question(s)', file=sys.stderr)
+            items.extend(dict(item, topic=topic) for item in generated[:args.generate])
+
+    try:
+        topics = question_pack.compile_pack(items, args.output)
+    except question_pack.PackError as error:
+        print(error, file=sys.stderr)
+        return 1
+    for topic, count in topics.items():
+        print(f'{topic}: {count}')
+    print(f'Wrote {sum(topics.values())} question(s) in {len(topics)} topic(s) to {args.output}')
+    return 0
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog='know_zone', description='Know-Zone server and maintenance commands')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    serve_parser = commands.add_parser('serve', help='Run the production server')
+    serve_parser.add_argument('--host', default=os.getenv('KNOW_ZONE_HOST', '0.0.0.0'))
+    serve_parser.add_argument('--port', type=int, default=_env_int('KNOW_ZONE_PORT', 5000))
+    serve_parser.add_argument('--workers', type=int, default=_env_int('KNOW_ZONE_WORKERS', 1),
+                              help='Worker processes; more than one runs gunicorn with eventlet workers')
+    serve_parser.add_argument('--graceful-timeout', type=float, default=_env_int('KNOW_ZONE_GRACEFUL_TIMEOUT', 30),
+                              help='Seconds to wait for in-flight requests on shutdown')
+    serve_parser.add_argument('--access-log', action='store_true')
+    serve_parser.set_defaults(handler=serve)
+
+    maintenance_parser = commands.add_parser(
+        'maintenance', help='Expire and archive old sessions, then vacuum and analyze the database',
+    )
+    maintenance_parser.add_argument('--full-vacuum', action='store_true',
+                                    help='Rewrite the whole database; blocks writers while it runs')
+    maintenance_parser.add_argument('--json', action='store_true', help='Print the report as JSON')
+    maintenance_parser.set_defaults(handler=run_maintenance)
+
+    backfill_parser = commands.add_parser(
+        'backfill-stats', help='Add completed games recorded before stats existed to the aggregate tables',
+    )
+    backfill_parser.add_argument('--batch-size', type=int, default=500, help='Games per transaction')
+    backfill_parser.set_defaults(handler=backfill_stats)
+
+    pack_parser = commands.add_parser(
+        'compile-pack', help='Compile authored or generated questions into a topic-indexed question pack',
+    )
+    pack_parser.add_argument('sources', nargs='*', help='JSON or JSON-lines files of questions')
+    pack_parser.add_argument('--output', default=os.getenv(
+        'QUESTION_PACK_PATH', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'instance', 'question_pack.db'),
+    ))
+    pack_parser.add_argument('--topic', default='general', help='Topic for items that do not name one')
+    pack_parser.add_argument('--builtin', action='store_true', help='Include the built-in fallback questions')
+    pack_parser.add_argument('--generate', type=int, default=0, help='Questions to generate per topic with the LLM')
+    pack_parser.add_argument('--generate-topic', action='append', help='Topic to generate for; repeatable')
+    pack_parser.set_defaults(handler=compile_question_pack)
+
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    return args.handler(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,90 @@
+import base64
+import json
+import threading
+from datetime import datetime
+
+from sqlalchemy import and_, func, or_
+
+from models import db, LeaderboardEntry
+
+def serialize_entry(entry):
+    return {
+        'student1': entry.student1_name,
+        'student2': entry.student2_name,
+        'matching_answers': entry.matching_answers,
+        'score': entry.score,
+        'date': entry.date.strftime('%m/%d/%Y')
+    }
+
+def encode_cursor(entry):
+    raw = json.dumps([entry.score, entry.date.isoformat(), entry.id]).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+def decode_cursor(cursor):
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        score, date, entry_id = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+        return int(score), datetime.fromisoformat(date), int(entry_id)
+    except (ValueError, TypeError):
+        raise ValueError('Invalid cursor')
+
+def ranked_query():
+    return LeaderboardEntry.query.order_by(
+        LeaderboardEntry.score.desc(), LeaderboardEntry.date.asc(), LeaderboardEntry.id.asc()
+    )
+
+def fetch_page(limit, cursor=None):
+    """Return ``(rows, next_cursor)`` ordered by score, earliest entry first on ties."""
+    query = ranked_query()
+    if cursor:
+        score, date, entry_id = decode_cursor(cursor)
+        query = query.filter(or_(
+            LeaderboardEntry.score < score,
+            and_(LeaderboardEntry.score == score, or_(
+                LeaderboardEntry.date > date,
+                and_(LeaderboardEntry.date == date, LeaderboardEntry.id > entry_id),
+            )),
+        ))
+    entries = query.limit(limit + 1).all()
+    next_cursor = encode_cursor(entries[limit - 1]) if len(entries) > limit else None
+    return [serialize_entry(entry) for entry in entries[:limit]], next_cursor
+
+class TopSnapshot:
+    """Serialized top-N leaderboard, rebuilt after a new entry is inserted.
+
+    The newest entry id is checked on every read so a snapshot built by one worker
+    is also dropped when another worker adds an entry.
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self._lock = threading.Lock()
+        self._snapshot = None
+
+    def invalidate(self):
+        with self._lock:
+            self._snapshot = None
+
+    def get(self):
+        latest_id = db.session.query(func.max(LeaderboardEntry.id)).scalar()
+        with self._lock:
+            snapshot = self._snapshot
+        if snapshot is not None and snapshot['latest_id'] == latest_id:
+            return snapshot
+        entries = ranked_query().limit(self.size + 1).all()
+        snapshot = {
+            'latest_id': latest_id,
+            'entries': [serialize_entry(entry) for entry in entries[:self.size]],
+            'cursors': [encode_cursor(entry) for entry in entries[:self.size]],
+            'has_more': len(entries) > self.size,
+        }
+        with self._lock:
+            self._snapshot = snapshot
+        return snapshot
+
+    def page(self, limit):
+        snapshot = self.get()
+        rows = snapshot['entries'][:limit]
+        more = len(snapshot['entries']) > limit or snapshot['has_more']
+        next_cursor = snapshot['cursors'][limit - 1] if more and rows and len(rows) == limit else None
+        return rows, next_cursor
@@ -0,0 +1,375 @@
+import logging
+import os
+import threading
+import time
+from datetime import datetime
+
+from sqlalchemy import (
+    Column, DateTime, Integer, MetaData, String, Table, Text, UniqueConstraint, and_, create_engine, func, inspect,
+    or_, text,
+)
+
+from models import db, Answer, GameSession, LeaderboardEntry, Participant
+import stats
+
+BATCH_SIZE = int(os.getenv('MAINTENANCE_BATCH_SIZE', '500'))
+VACUUM_PAGES = int(os.getenv('MAINTENANCE_VACUUM_PAGES', '0'))
+ANALYSIS_LIMIT = int(os.getenv('MAINTENANCE_ANALYSIS_LIMIT', '400'))
+
+log = logging.getLogger('know_zone.maintenance')
+
+# The archive is a separate SQLite file. Codes are reused, so archived rows are
+# keyed by session code plus the session's creation time.
+archive_metadata = MetaData()
+
+archived_sessions = Table(
+    'archived_session', archive_metadata,
+    Column('id', Integer, primary_key=True),
+    Column('code', String(16), nullable=False),
+    Column('student1_name', String(100)),
+    Column('student2_name', String(100)),
+    Column('status', String(20)),
+    Column('question_ids', Text),
+    Column('max_participants', Integer),
+    Column('participant_count', Integer),
+    Column('created_at', DateTime),
+    Column('completed_at', DateTime),
+    Column('archived_at', DateTime, nullable=False),
+    UniqueConstraint('code', 'created_at', name='uq_archived_session'),
+)
+
+archived_participants = Table(
+    'archived_participant', archive_metadata,
+    Column('id', Integer, primary_key=True),
+    Column('session_code', String(16), nullable=False),
+    Column('session_created_at', DateTime),
+    Column('number', Integer, nullable=False),
+    Column('name', String(100), nullable=False),
+    Column('score', Integer),
+    Column('joined_at', DateTime),
+    UniqueConstraint('session_code', 'session_created_at', 'number', name='uq_archived_participant'),
+)
+
+archived_answers = Table(
+    'archived_answer', archive_metadata,
+    Column('id', Integer, primary_key=True),
+    Column('session_code', String(16), nullable=False),
+    Column('session_created_at', DateTime),
+    Column('student_number', Integer, nullable=False),
+    Column('question_index', Integer, nullable=False),
+    Column('answer', Integer, nullable=False),
+    Column('created_at', DateTime),
+    UniqueConstraint(
+        'session_code', 'session_created_at', 'student_number', 'question_index', name='uq_archived_answer',
+    ),
+)
+
+archived_leaderboard_entries = Table(
+    'archived_leaderboard_entry', archive_metadata,
+    Column('id', Integer, primary_key=True),
+    Column('student1_name', String(100), nullable=False),
+    Column('student2_name', String(100), nullable=False),
+    Column('matching_answers', Integer, nullable=False),
+    Column('score', Integer, nullable=False),
+    Column('date', DateTime),
+    Column('archived_at', DateTime, nullable=False),
+    UniqueConstraint('student1_name', 'student2_name', 'date', name='uq_archived_leaderboard_entry'),
+)
+
+archived_users = Table(
+    'archived_user', archive_metadata,
+    Column('id', String(36), primary_key=True),
+    Column('username', String(100)),
+    Column('created_at', DateTime),
+    Column('archived_at', DateTime, nullable=False),
+)
+
+_archive_engines = {}
+_archive_lock = threading.Lock()
+
+
+def archive_engine(path):
+    with _archive_lock:
+        engine = _archive_engines.get(path)
+        if engine is None:
+            engine = _archive_engines[path] = create_engine('sqlite:///' + path)
+            archive_metadata.create_all(engine)
+        return engine
+
+
+def _write_archive(path, rows_by_table):
+    with archive_engine(path).begin() as connection:
+        for table, rows in rows_by_table:
+            if rows:
+                connection.execute(table.insert().prefix_with('OR IGNORE'), rows)
+
+
+def _batches(items):
+    for start in range(0, len(items), BATCH_SIZE):
+        yield items[start:start + BATCH_SIZE]
+
+
+def stale_sessions(now, completed_grace, waiting_ttl, abandoned_ttl):
+    """Return ``(finished, expired)`` codes.
+
+    ``finished`` are games to archive: completed more than ``completed_grace`` ago, or
+    joined but unfinished after ``abandoned_ttl``. ``expired`` are games nobody joined,
+    still waiting after ``waiting_ttl`` or ``abandoned_ttl``.
+    """
+    # Games completed before completed_at existed have it NULL; their creation time stands in.
+    completed_at = func.coalesce(GameSession.completed_at, GameSession.created_at)
+    rows = db.session.query(GameSession.code, GameSession.status).filter(or_(
+        and_(GameSession.status == 'completed', completed_at < now - completed_grace),
+        and_(GameSession.status == 'waiting', GameSession.created_at < now - waiting_ttl),
+        and_(GameSession.status != 'completed', GameSession.created_at < now - abandoned_ttl),
+    )).all()
+    finished = [code for code, status in rows if status != 'waiting']
+    expired = [code for code, status in rows if status == 'waiting']
+    return finished, expired
+
+
+def _delete_sessions(codes):
+    Answer.query.filter(Answer.session_code.in_(codes)).delete(synchronize_session=False)
+    Participant.query.filter(Participant.session_code.in_(codes)).delete(synchronize_session=False)
+    GameSession.query.filter(GameSession.code.in_(codes)).delete(synchronize_session=False)
+
+
+def expire_sessions(codes):
+    """Delete games nobody joined with their participants and answers; nothing of them is kept."""
+    for batch in _batches(codes):
+        _delete_sessions(batch)
+        db.session.commit()
+    return len(codes)
+
+
+def archive_sessions(codes, archive_path):
+    """Move games to the archive file, completed or abandoned part-way.
+
+    Completed games not yet in the aggregates (see ``stats.record_game``) are added in the same
+    transaction as the delete, so each game is counted once. Archive inserts ignore
+    rows already there, so a batch interrupted after the archive write is simply
+    archived again on the next run.
+    """
+    archived = 0
+    for batch in _batches(codes):
+        sessions = GameSession.query.filter(GameSession.code.in_(batch)).all()
+        if not sessions:
+            continue
+        created = {session.code: session.created_at for session in sessions}
+        participants = Participant.query.filter(Participant.session_code.in_(created)).all()
+        answers = Answer.query.filter(Answer.session_code.in_(created)).all()
+        archived_at = datetime.utcnow()
+
+        _write_archive(archive_path, [
+            (archived_sessions, [{
+                'code': session.code,
+                'student1_name': session.student1_name,
+                'student2_name': session.student2_name,
+                'status': session.status,
+                'question_ids': session.question_ids,
+                'max_participants': session.max_participants,
+                'participant_count': session.participant_count,
+                'created_at': session.created_at,
+                'completed_at': session.completed_at,
+                'archived_at': archived_at,
+            } for session in sessions]),
+            (archived_participants, [{
+                'session_code': participant.session_code,
+                'session_created_at': created[participant.session_code],
+                'number': participant.number,
+                'name': participant.name,
+                'score': participant.score,
+                'joined_at': participant.joined_at,
+            } for participant in participants]),
+            (archived_answers, [{
+                'session_code': answer.session_code,
+                'session_created_at': created[answer.session_code],
+                'student_number': answer.student_number,
+                'question_index': answer.question_index,
+                'answer': answer.answer,
+                'created_at': answer.created_at,
+            } for answer in answers]),
+        ])
+
+        stats.record_sessions([session for session in sessions if session.status == 'completed'])
+        _delete_sessions(list(created))
+        db.session.commit()
+        archived += len(sessions)
+    return archived
+
+
+def archive_leaderboard(before, archive_path):
+    """Move leaderboard entries dated before ``before`` to the archive file."""
+    archived = 0
+    while True:
+        entries = (
+            LeaderboardEntry.query.filter(LeaderboardEntry.date < before)
+            .order_by(LeaderboardEntry.id).limit(BATCH_SIZE).all()
+        )
+        if not entries:
+            return archived
+        archived_at = datetime.utcnow()
+        _write_archive(archive_path, [(archived_leaderboard_entries, [{
+            'student1_name': entry.student1_name,
+            'student2_name': entry.student2_name,
+            'matching_answers': entry.matching_answers,
+            'score': entry.score,
+            'date': entry.date,
+            'archived_at': archived_at,
+        } for entry in entries])])
+        LeaderboardEntry.query.filter(
+            LeaderboardEntry.id.in_([entry.id for entry in entries])
+        ).delete(synchronize_session=False)
+        db.session.commit()
+        archived += len(entries)
+
+
+def drop_user_table(archive_path):
+    """Archive and drop the ``user`` table, which nothing reads or writes."""
+    if 'user' not in inspect(db.engine).get_table_names():
+        return 0
+    rows = db.session.execute(text('SELECT id, username, created_at FROM "user"')).mappings().all()
+    archived_at = datetime.utcnow()
+    _write_archive(archive_path, [(archived_users, [
+        {
+            'id': row['id'],
+            'username': row['username'],
+            'created_at': datetime.fromisoformat(row['created_at']) if row['created_at'] else None,
+            'archived_at': archived_at,
+        }
+        for row in rows
+    ])])
+    db.session.execute(text('DROP TABLE "user"'))
+    db.session.commit()
+    return len(rows)
+
+
+def _page_stats(connection):
+    page_size = connection.exec_driver_sql('PRAGMA page_size').scalar()
+    return {
+        'pages': connection.exec_driver_sql('PRAGMA page_count').scalar(),
+        'free_pages': connection.exec_driver_sql('PRAGMA freelist_count').scalar(),
+        'page_size': page_size,
+    }
+
+
+def compact(full_vacuum=False, vacuum_pages=VACUUM_PAGES, analysis_limit=ANALYSIS_LIMIT):
+    """Return free pages to the file system and refresh the query planner's statistics.
+
+    Databases with incremental auto-vacuum give back up to ``vacuum_pages`` free pages
+    (0 for all). Older databases need one ``full_vacuum``, which rewrites the file and
+    switches it to incremental mode; it blocks writers while it runs. ANALYZE reads
+    at most ``analysis_limit`` rows per index so it stays cheap on a large database.
+    """
+    with db.engine.connect().execution_options(isolation_level='AUTOCOMMIT') as connection:
+        before = _page_stats(connection)
+        driver_connection = connection.connection.driver_connection
+        if full_vacuum:
+            connection.exec_driver_sql('PRAGMA auto_vacuum=INCREMENTAL')
+            connection.exec_driver_sql('VACUUM')
+            vacuum = 'full'
+        elif connection.exec_driver_sql('PRAGMA auto_vacuum').scalar() == 2:
+            # Run as a script: a single execute() frees only one page.
+            driver_connection.executescript(f'PRAGMA incremental_vacuum({int(vacuum_pages)})')
+            vacuum = 'incremental'
+        else:
+            vacuum = 'needs full vacuum'
+        # Measured before ANALYZE, which can grow the file by writing sqlite_stat1.
+        vacuumed = _page_stats(connection)
+        connection.exec_driver_sql(f'PRAGMA analysis_limit={int(analysis_limit)}')
+        connection.exec_driver_sql('ANALYZE')
+        checkpoint_busy = connection.exec_driver_sql('PRAGMA wal_checkpoint(TRUNCATE)').first()[0]
+        after = _page_stats(connection)
+    return {
+        'vacuum': vacuum,
+        'pages_freed': max(0, before['pages'] - vacuumed['pages']),
+        'bytes_freed': max(0, before['pages'] - vacuumed['pages']) * before['page_size'],
+        'free_pages': after['free_pages'],
+        'database_bytes': after['pages'] * after['page_size'],
+        'wal_truncated': not checkpoint_busy,
+    }
+
+
+def run(now, completed_grace, waiting_ttl, abandoned_ttl, archive_path, leaderboard_retention=None,
+        full_vacuum=False, release=None):
+    """Expire, archive and compact in one pass and return a report of what was reclaimed.
+
+    ``release`` is called with the codes of every removed session so they can be reused.
+    """
+    started = time.perf_counter()
+    finished, expired = stale_sessions(now, completed_grace, waiting_ttl, abandoned_ttl)
+    report = {
+        'expired_sessions': expire_sessions(expired),
+        'archived_sessions': archive_sessions(finished, archive_path),
+        'archived_leaderboard_entries': (
+            archive_leaderboard(now - leaderboard_retention, archive_path) if leaderboard_retention else 0
+        ),
+        'archived_users': drop_user_table(archive_path),
+    }
+    if release is not None:
+        release(expired + finished)
+    report.update(compact(full_vacuum))
+    report['duration_seconds'] = round(time.perf_counter() - started, 3)
+    return report
+
+
+class MaintenanceTask:
+    """Runs ``job`` every ``interval`` seconds on a background thread and keeps its last report."""
+
+    def __init__(self, job, interval):
+        self.job = job
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._runs = 0
+        self._errors = 0
+        self._last_report = None
+        self._last_run_at = None
+
+    def start(self):
+        if self.interval <= 0:
+            return
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._loop, name='maintenance', daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout=1.0):
+        self._stop.set()
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            thread.join(timeout)
+
+    def run_once(self):
+        try:
+            report = self.job()
+        except Exception:
+            log.exception('Maintenance run failed')
+            with self._lock:
+                self._errors += 1
+            return None
+        with self._lock:
+            self._runs += 1
+            self._last_report = report
+            self._last_run_at = datetime.utcnow().isoformat()
+        log.info('Maintenance run: %s', report)
+        return report
+
+    def stats(self):
+        with self._lock:
+            return {
+                'interval': self.interval,
+                'running': self._thread is not None,
+                'runs': self._runs,
+                'errors': self._errors,
+                'last_run_at': self._last_run_at,
+                'last_report': self._last_report,
+            }
+
+    def _loop(self):
+        while not self._stop.wait(self.interval):
+            self.run_once()
@@ -0,0 +1,298 @@
+import cProfile
+import functools
+import inspect
+import io
+import logging
+import os
+import pstats
+import threading
+import time
+from bisect import bisect_left
+
+from flask import g, has_request_context, request
+from flask.json.provider import DefaultJSONProvider
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+LLM_BUCKETS = (0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34)
+
+SLOW_REQUEST_SECONDS = float(os.getenv('METRICS_SLOW_REQUEST_MS', '0')) / 1000
+PROFILE_SLOW_REQUESTS = os.getenv('METRICS_PROFILE_SLOW_REQUESTS', '0') == '1'
+
+slow_log = logging.getLogger('know_zone.slow_requests')
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value)
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    escaped = (
+        (name, str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+        for name, value in labels
+    )
+    return '{' + ','.join(f'{name}="{value}"' for name, value in escaped) + '}'
+
+
+class Counter:
+    kind = 'counter'
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1.0, **labels):
+        key = tuple(labels[name] for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def samples(self):
+        with self._lock:
+            values = dict(self._values)
+        for key, value in sorted(values.items()):
+            yield self.name, tuple(zip(self.labelnames, key)), value
+
+
+class Histogram:
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, buckets, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.buckets = tuple(sorted(buckets)) + (float('inf'),)
+        self.labelnames = tuple(labelnames)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(labels[name] for name in self.labelnames)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * len(self.buckets), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def samples(self):
+        with self._lock:
+            series = {key: (list(counts), total, count) for key, (counts, total, count) in self._series.items()}
+        for key, (counts, total, count) in sorted(series.items()):
+            labels = tuple(zip(self.labelnames, key))
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                yield f'{self.name}_bucket', labels + (('le', _format_value(float(bound))),), cumulative
+            yield f'{self.name}_sum', labels, total
+            yield f'{self.name}_count', labels, count
+
+
+class Collected:
+    """Read at scrape time from ``collect``, which returns a number or a ``{labels: value}`` dict.
+
+    ``kind`` is ``gauge``, or ``counter`` for totals kept elsewhere, e.g. in ``get_llm_stats``.
+    """
+
+    def __init__(self, name, documentation, collect, labelnames=(), kind='gauge'):
+        self.name = name
+        self.documentation = documentation
+        self.collect = collect
+        self.labelnames = tuple(labelnames)
+        self.kind = kind
+
+    def samples(self):
+        value = self.collect()
+        if not isinstance(value, dict):
+            value = {(): value}
+        for key, sample in sorted(value.items()):
+            if sample is None:
+                continue
+            key = key if isinstance(key, tuple) else (key,)
+            yield self.name, tuple(zip(self.labelnames, key)), float(sample)
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self.register(Counter(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, buckets, labelnames=()):
+        return self.register(Histogram(name, documentation, buckets, labelnames))
+
+    def collected(self, name, documentation, collect, labelnames=(), kind='gauge'):
+        return self.register(Collected(name, documentation, collect, labelnames, kind))
+
+    def render(self):
+        with self._lock:
+            metrics = list(self._metrics)
+        lines = []
+        for metric in metrics:
+            lines.append(f'# HELP {metric.name} {metric.documentation}')
+            lines.append(f'# TYPE {metric.name} {metric.kind}')
+            for name, labels, value in metric.samples():
+                lines.append(f'{name}{_format_labels(labels)} {_format_value(value)}')
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+request_duration = registry.histogram(
+    'know_zone_request_duration_seconds', 'HTTP request latency by route',
+    LATENCY_BUCKETS, ('endpoint', 'method', 'status'),
+)
+request_queries = registry.histogram(
+    'know_zone_request_queries', 'SQL statements executed per request', QUERY_BUCKETS, ('endpoint',),
+)
+request_db_seconds = registry.counter(
+    'know_zone_request_db_seconds_total', 'Time spent in SQL statements by route', ('endpoint',),
+)
+request_json_seconds = registry.counter(
+    'know_zone_request_json_seconds_total', 'Time spent serialising JSON responses by route', ('endpoint',),
+)
+db_query_duration = registry.histogram(
+    'know_zone_db_query_duration_seconds', 'Latency of individual SQL statements', LATENCY_BUCKETS,
+)
+llm_call_duration = registry.histogram(
+    'know_zone_llm_call_duration_seconds', 'Latency of question generation calls, including fallbacks',
+    LLM_BUCKETS, ('function', 'outcome'),
+)
+
+
+class TimedJSONProvider(DefaultJSONProvider):
+    """Adds the time spent in ``dumps`` during a request to the request's JSON timer."""
+
+    def dumps(self, obj, **kwargs):
+        if not has_request_context():
+            return super().dumps(obj, **kwargs)
+        started = time.perf_counter()
+        try:
+            return super().dumps(obj, **kwargs)
+        finally:
+            g.metrics_json_seconds = g.get('metrics_json_seconds', 0.0) + time.perf_counter() - started
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    # Kept on the statement's own context, so one that fails leaves nothing behind on the connection.
+    if context is not None:
+        context.metrics_query_started = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = getattr(context, 'metrics_query_started', None)
+    if started is None:
+        return
+    elapsed = time.perf_counter() - started
+    db_query_duration.observe(elapsed)
+    if has_request_context() and 'metrics_started' in g:
+        g.metrics_queries += 1
+        g.metrics_db_seconds += elapsed
+        if SLOW_REQUEST_SECONDS:
+            g.metrics_statements.append((elapsed, statement))
+
+
+def _before_request():
+    g.metrics_started = time.perf_counter()
+    g.metrics_queries = 0
+    g.metrics_db_seconds = 0.0
+    g.metrics_json_seconds = 0.0
+    g.metrics_statements = []
+    if PROFILE_SLOW_REQUESTS and SLOW_REQUEST_SECONDS:
+        g.metrics_profiler = cProfile.Profile()
+        g.metrics_profiler.enable()
+
+
+def _after_request(response):
+    if 'metrics_started' not in g:
+        return response
+    elapsed = time.perf_counter() - g.metrics_started
+    profiler = g.pop('metrics_profiler', None)
+    if profiler is not None:
+        profiler.disable()
+    endpoint = request.endpoint or 'unmatched'
+    request_duration.observe(elapsed, endpoint=endpoint, method=request.method, status=str(response.status_code))
+    request_queries.observe(g.metrics_queries, endpoint=endpoint)
+    request_db_seconds.inc(g.metrics_db_seconds, endpoint=endpoint)
+    request_json_seconds.inc(g.metrics_json_seconds, endpoint=endpoint)
+    if SLOW_REQUEST_SECONDS and elapsed >= SLOW_REQUEST_SECONDS:
+        _log_slow_request(endpoint, elapsed, response.status_code, profiler)
+    return response
+
+
+def _log_slow_request(endpoint, elapsed, status, profiler):
+    lines = [
+        f'{request.method} {request.full_path.rstrip("?")} -> {status} ({endpoint}) took {elapsed * 1000:.1f} ms: '
+        f'{g.metrics_queries} queries in {g.metrics_db_seconds * 1000:.1f} ms, '
+        f'JSON {g.metrics_json_seconds * 1000:.1f} ms'
+    ]
+    for seconds, statement in sorted(g.metrics_statements, reverse=True)[:5]:
+        lines.append(f'  {seconds * 1000:8.2f} ms  {" ".join(statement.split())[:200]}')
+    if profiler is not None:
+        output = io.StringIO()
+        pstats.Stats(profiler, stream=output).sort_stats('cumulative').print_stats(25)
+        lines.append(output.getvalue())
+    slow_log.warning('\n'.join(lines))
+
+
+def init_app(app):
+    app.json = TimedJSONProvider(app)
+    app.before_request(_before_request)
+    app.after_request(_after_request)
+    if not event.contains(Engine, 'before_cursor_execute', _before_cursor_execute):
+        event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+
+
+def timed(function, name=None):
+    """Wrap a question generator so each call lands in ``llm_call_duration``.
+
+    Generators (streamed questions) are timed until they are exhausted.
+    """
+    name = name or function.__name__
+
+    def record(started, outcome):
+        llm_call_duration.observe(time.perf_counter() - started, function=name, outcome=outcome)
+
+    def consume(started, iterator):
+        try:
+            yield from iterator
+        except Exception:
+            record(started, 'error')
+            raise
+        record(started, 'ok')
+
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            result = function(*args, **kwargs)
+        except Exception:
+            record(started, 'error')
+            raise
+        if inspect.isgenerator(result):
+            return consume(started, result)
+        record(started, 'ok')
+        return result
+
+    return wrapper
@@ -0,0 +1,288 @@
+from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import event, func, inspect, text
+from sqlalchemy.engine import Engine
+import json
+import os
+import sqlite3
+import zlib
+from datetime import datetime
+
+db = SQLAlchemy()
+
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv('SQLITE_BUSY_TIMEOUT_MS', '5000'))
+
+@event.listens_for(Engine, 'connect')
+def _configure_sqlite(dbapi_connection, connection_record):
+    if not isinstance(dbapi_connection, sqlite3.Connection):
+        return
+    cursor = dbapi_connection.cursor()
+    # Only takes effect on a new, empty database; existing ones switch on their next full VACUUM.
+    cursor.execute('PRAGMA auto_vacuum=INCREMENTAL')
+    # WAL lets readers proceed while a write is in flight; NORMAL sync is durable under WAL
+    # except for the last transactions before a power loss.
+    cursor.execute('PRAGMA journal_mode=WAL')
+    cursor.execute('PRAGMA synchronous=NORMAL')
+    cursor.execute(f'PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}')
+    cursor.close()
+
+class GameSession(db.Model):
+    code = db.Column(db.String(16), primary_key=True)
+    student1_name = db.Column(db.String(100), nullable=False)
+    student2_name = db.Column(db.String(100), nullable=True)
+    student1_score = db.Column(db.Integer, default=0)
+    student2_score = db.Column(db.Integer, default=0)
+    status = db.Column(db.String(20), default='waiting')
+    current_question = db.Column(db.Integer, default=0)
+    question_ids = db.Column(db.Text, default='[]')
+    questions_ready = db.Column(db.Boolean, nullable=False, default=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+    max_participants = db.Column(db.Integer, nullable=False, default=2)
+    participant_count = db.Column(db.Integer, nullable=False, default=1)
+    stats_recorded = db.Column(db.Boolean, nullable=False, default=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    completed_at = db.Column(db.DateTime, nullable=True)
+
+    def participant_numbers(self):
+        return list(range(1, (self.participant_count or 1) + 1))
+
+    def get_participants(self):
+        return Participant.query.filter_by(session_code=self.code).order_by(Participant.number).all()
+
+    def get_answers(self):
+        answers = {number: [] for number in self.participant_numbers()}
+        rows = (
+            db.session.query(Answer.student_number, Answer.answer)
+            .filter(Answer.session_code == self.code)
+            .order_by(Answer.student_number, Answer.question_index)
+            .all()
+        )
+        for student_number, answer in rows:
+            answers.setdefault(student_number, []).append(answer)
+        return answers
+
+    def answer_counts(self):
+        counts = {number: 0 for number in self.participant_numbers()}
+        rows = (
+            db.session.query(Answer.student_number, func.count(Answer.id))
+            .filter(Answer.session_code == self.code)
+            .group_by(Answer.student_number)
+            .all()
+        )
+        counts.update(rows)
+        return counts
+
+    def get_question_ids(self):
+        return json.loads(self.question_ids or '[]')
+
+    def set_question_ids(self, ids):
+        self.question_ids = json.dumps(ids)
+
+db.Index('ix_game_session_status_created', GameSession.status, GameSession.created_at)
+db.Index('ix_game_session_status_completed', GameSession.status, GameSession.completed_at)
+
+class Participant(db.Model):
+    __table_args__ = (
+        db.UniqueConstraint('session_code', 'number', name='uq_participant_slot'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    session_code = db.Column(db.String(16), nullable=False)
+    number = db.Column(db.Integer, nullable=False)
+    name = db.Column(db.String(100), nullable=False)
+    score = db.Column(db.Integer, nullable=False, default=0)
+    joined_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+class LeaderboardEntry(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    student1_name = db.Column(db.String(100), nullable=False)
+    student2_name = db.Column(db.String(100), nullable=False)
+    matching_answers = db.Column(db.Integer, nullable=False)
+    score = db.Column(db.Integer, nullable=False)
+    date = db.Column(db.DateTime, default=datetime.utcnow)
+
+db.Index('ix_leaderboard_entry_score_date', LeaderboardEntry.score.desc(), LeaderboardEntry.date)
+db.Index('uq_leaderboard_entry_pair', LeaderboardEntry.student1_name, LeaderboardEntry.student2_name, unique=True)
+db.Index('ix_leaderboard_entry_date', LeaderboardEntry.date)
+
+class GameRollup(db.Model):
+    """Daily totals of completed games, added to as each game completes and kept after it is archived."""
+    day = db.Column(db.Date, primary_key=True)
+    games = db.Column(db.Integer, nullable=False, default=0)
+    participants = db.Column(db.Integer, nullable=False, default=0)
+    answers = db.Column(db.Integer, nullable=False, default=0)
+    total_score = db.Column(db.Integer, nullable=False, default=0)
+    best_score = db.Column(db.Integer, nullable=False, default=0)
+    pairs = db.Column(db.Integer, nullable=False, default=0)
+    matching_answers = db.Column(db.Integer, nullable=False, default=0)
+    compared_answers = db.Column(db.Integer, nullable=False, default=0)
+
+    def to_dict(self):
+        return {
+            'day': self.day.isoformat(),
+            'games': self.games,
+            'participants': self.participants,
+            'answers': self.answers,
+            'average_score': round(self.total_score / self.participants, 1) if self.participants else None,
+            'best_score': self.best_score,
+            'pairs': self.pairs,
+            'agreement_percent': (
+                round(100 * self.matching_answers / self.compared_answers, 1) if self.compared_answers else None
+            ),
+        }
+
+class QuestionStats(db.Model):
+    """Running answer counts for a bank question over completed games.
+
+    ``split_pairs`` counts pairs of players in the same game who chose differently;
+    the rates are kept up to date so they can be indexed.
+    """
+    question_id = db.Column(db.Integer, primary_key=True)
+    answers = db.Column(db.Integer, nullable=False, default=0)
+    option1_count = db.Column(db.Integer, nullable=False, default=0)
+    pairs = db.Column(db.Integer, nullable=False, default=0)
+    split_pairs = db.Column(db.Integer, nullable=False, default=0)
+    option1_rate = db.Column(db.Float, nullable=True)
+    split_rate = db.Column(db.Float, nullable=True)
+
+    def to_dict(self):
+        return {
+            'question_id': self.question_id,
+            'answers': self.answers,
+            'option1_percent': round(100 * self.option1_rate, 1) if self.option1_rate is not None else None,
+            'option2_percent': round(100 * (1 - self.option1_rate), 1) if self.option1_rate is not None else None,
+            'pairs': self.pairs,
+            'split_percent': round(100 * self.split_rate, 1) if self.split_rate is not None else None,
+        }
+
+db.Index('ix_question_stats_split_rate', QuestionStats.split_rate.desc())
+db.Index('ix_question_stats_option1_rate', QuestionStats.option1_rate.desc())
+db.Index('ix_question_stats_answers', QuestionStats.answers.desc())
+
+class Answer(db.Model):
+    __table_args__ = (
+        db.UniqueConstraint('session_code', 'student_number', 'question_index', name='uq_answer_slot'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    session_code = db.Column(db.String(16), nullable=False)
+    student_number = db.Column(db.Integer, nullable=False)
+    question_index = db.Column(db.Integer, nullable=False)
+    answer = db.Column(db.Integer, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+class Question(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    content_hash = db.Column(db.String(64), nullable=False, unique=True)
+    question = db.Column(db.Text, nullable=False)
+    option1 = db.Column(db.Text, nullable=False)
+    option2 = db.Column(db.Text, nullable=False)
+    use_count = db.Column(db.Integer, nullable=False, default=0)
+    last_used_at = db.Column(db.DateTime, nullable=True, index=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def to_dict(self):
+        return {'question': self.question, 'option1': self.option1, 'option2': self.option2}
+
+def _column_default_sql(column):
+    default = column.default
+    if default is None or not default.is_scalar:
+        return ''
+    value = default.arg
+    if isinstance(value, bool):
+        value = int(value)
+    if isinstance(value, (int, float)):
+        return f' DEFAULT {value}'
+    return " DEFAULT '{}'".format(str(value).replace("'", "''"))
+
+def schema_fingerprint():
+    """A checksum of every table, column and index name, stored in ``PRAGMA user_version``."""
+    names = []
+    for table in db.metadata.sorted_tables:
+        names.extend(f'{table.name}.{column.name}' for column in table.columns)
+        names.extend(f'{table.name}:{index.name}' for index in table.indexes)
+    return zlib.crc32('\n'.join(sorted(names)).encode('utf-8')) & 0x7fffffff
+
+def ensure_schema():
+    """Create missing tables, and add columns and indexes introduced since the database was created.
+
+    Skipped when the database was last upgraded to the current fingerprint, so a
+    worker starting against an up-to-date database only reads one pragma.
+    Returns False when it was skipped.
+    """
+    fingerprint = schema_fingerprint()
+    with db.engine.connect() as connection:
+        if connection.exec_driver_sql('PRAGMA user_version').scalar() == fingerprint:
+            return False
+    db.create_all()
+    inspector = inspect(db.engine)
+    added = set()
+    with db.engine.begin() as connection:
+        _dedupe_leaderboard(connection, inspector)
+        for table in db.metadata.sorted_tables:
+            existing = {column['name'] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing:
+                    continue
+                column_type = column.type.compile(dialect=db.engine.dialect)
+                connection.execute(text(
+                    f'ALTER TABLE "{table.name}" ADD COLUMN "{column.name}" {column_type}{_column_default_sql(column)}'
+                ))
+                added.add((table.name, column.name))
+            for index in table.indexes:
+                index.create(connection, checkfirst=True)
+        _migrate_legacy_answers(connection, inspector)
+        if ('game_session', 'participant_count') in added:
+            _migrate_participants(connection)
+        connection.exec_driver_sql(f'PRAGMA user_version={fingerprint}')
+    return True
+
+def _migrate_legacy_answers(connection, inspector):
+    legacy_columns = {'student1_answers', 'student2_answers'}
+    columns = {column['name'] for column in inspector.get_columns('game_session')}
+    if not legacy_columns <= columns:
+        return
+    rows = connection.execute(text(
+        "SELECT code, student1_answers, student2_answers FROM game_session "
+        "WHERE COALESCE(student1_answers, '[]') != '[]' OR COALESCE(student2_answers, '[]') != '[]'"
+    )).all()
+    for code, student1_answers, student2_answers in rows:
+        for student_number, raw in ((1, student1_answers), (2, student2_answers)):
+            for question_index, answer in enumerate(json.loads(raw or '[]')):
+                connection.execute(
+                    text(
+                        "INSERT OR IGNORE INTO answer (session_code, student_number, question_index, answer, created_at) "
+                        "VALUES (:code, :student_number, :question_index, :answer, :created_at)"
+                    ),
+                    {'code': code, 'student_number': student_number, 'question_index': question_index,
+                     'answer': answer, 'created_at': datetime.utcnow()},
+                )
+        connection.execute(
+            text("UPDATE game_session SET student1_answers = '[]', student2_answers = '[]' WHERE code = :code"),
+            {'code': code},
+        )
+
+def _dedupe_leaderboard(connection, inspector):
+    # Entries used to be deduplicated by a racy read-then-insert; keep the first of each pair
+    # so the unique index can be built.
+    if 'uq_leaderboard_entry_pair' in {index['name'] for index in inspector.get_indexes('leaderboard_entry')}:
+        return
+    connection.execute(text(
+        "DELETE FROM leaderboard_entry WHERE id NOT IN "
+        "(SELECT MIN(id) FROM leaderboard_entry GROUP BY student1_name, student2_name)"
+    ))
+
+def _migrate_participants(connection):
+    # Sessions from before rooms kept their players in the student1/student2 columns.
+    connection.execute(text(
+        "INSERT OR IGNORE INTO participant (session_code, number, name, score, joined_at) "
+        "SELECT code, 1, student1_name, COALESCE(student1_score, 0), created_at FROM game_session"
+    ))
+    connection.execute(text(
+        "INSERT OR IGNORE INTO participant (session_code, number, name, score, joined_at) "
+        "SELECT code, 2, student2_name, COALESCE(student2_score, 0), created_at FROM game_session "
+        "WHERE COALESCE(student2_name, '') != ''"
+    ))
+    connection.execute(text(
+        "UPDATE game_session SET participant_count = "
+        "(SELECT COUNT(*) FROM participant WHERE participant.session_code = game_session.code)"
+    ))
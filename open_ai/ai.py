@@ -1,11 +1,26 @@
-from openai import OpenAI
 import os
 import json
-from typing import List, Dict, Optional
+import random
+import threading
+import time
+from collections import deque
+from typing import TYPE_CHECKING, Callable, Deque, Dict, Iterator, List, Optional, Union
 from dotenv import load_dotenv
 
+if TYPE_CHECKING:
+    from openai import OpenAI
+
 load_dotenv()
 
+OPENROUTER_BASE_URL = os.getenv("OPENROUTER_BASE_URL", "https://openrouter.ai/api/v1")
+CONNECT_TIMEOUT = float(os.getenv("OPENROUTER_CONNECT_TIMEOUT", "3"))
+READ_TIMEOUT = float(os.getenv("OPENROUTER_READ_TIMEOUT", "20"))
+MAX_RETRIES = int(os.getenv("OPENROUTER_MAX_RETRIES", "2"))
+RETRY_BACKOFF = float(os.getenv("OPENROUTER_RETRY_BACKOFF", "0.5"))
+MAX_CONNECTIONS = int(os.getenv("OPENROUTER_MAX_CONNECTIONS", "20"))
+BREAKER_FAILURES = int(os.getenv("OPENROUTER_BREAKER_FAILURES", "5"))
+BREAKER_RESET_AFTER = float(os.getenv("OPENROUTER_BREAKER_RESET_AFTER", "30"))
+
 DEFAULT_QUESTIONS: List[Dict[str, str]] = [
     {"question": "Would you rather...", "option1": "Read a new book", "option2": "Re-read your favorite book"},
     {"question": "Would you rather...", "option1": "Do a science project", "option2": "Write a short story"},
@@ -49,69 +64,515 @@ def _parse_json_response(text: str) -> Optional[List[Dict[str, str]]]:
                         continue
         return None
 
-def generate_questions(student1_name: str, student2_name: Optional[str] = None, count: int = 10, topic: Optional[str] = None) -> List[Dict[str, str]]:
-    api_key = os.getenv("OPENROUTER_API_KEY") or os.getenv("OPENAI_API_KEY")
-    model = os.getenv("OPENROUTER_MODEL", "openai/gpt-4o-mini")
+class CircuitBreaker:
+    """Stops calling the provider after repeated failures and probes it again after a cool-down."""
 
-    if not api_key:
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int, reset_after: float) -> None:
+        self.failure_threshold = max(1, failure_threshold)
+        self.reset_after = reset_after
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self.times_opened = 0
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.reset_after:
+                self.state = self.HALF_OPEN
+                self._probe_in_flight = False
+            if self.state == self.HALF_OPEN and not self._probe_in_flight:
+                self._probe_in_flight = True
+                return True
+            return False
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.state = self.CLOSED
+            self.consecutive_failures = 0
+            self._probe_in_flight = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.consecutive_failures += 1
+            self._probe_in_flight = False
+            if self.state == self.HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    self.times_opened += 1
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+
+    def snapshot(self) -> Dict[str, object]:
+        with self._lock:
+            return {
+                "state": self.state,
+                "consecutive_failures": self.consecutive_failures,
+                "times_opened": self.times_opened,
+            }
+
+
+_breaker = CircuitBreaker(BREAKER_FAILURES, BREAKER_RESET_AFTER)
+_client_lock = threading.Lock()
+_clients: Dict[str, "OpenAI"] = {}
+_stats_lock = threading.Lock()
+_latencies: Deque[float] = deque(maxlen=500)
+_counters: Dict[str, int] = {
+    "calls": 0,
+    "successes": 0,
+    "failures": 0,
+    "retries": 0,
+    "short_circuited": 0,
+    "parse_failures": 0,
+    "fallbacks": 0,
+}
+
+
+def _count(name: str, amount: int = 1) -> None:
+    with _stats_lock:
+        _counters[name] += amount
+
+
+def _get_client(api_key: str) -> "OpenAI":
+    with _client_lock:
+        client = _clients.get(api_key)
+        if client is None:
+            # The SDK takes a few hundred milliseconds to import and is only needed
+            # once there is an API key and something to generate.
+            import httpx
+            from openai import OpenAI
+
+            http_client = httpx.Client(
+                timeout=httpx.Timeout(READ_TIMEOUT, connect=CONNECT_TIMEOUT),
+                limits=httpx.Limits(max_connections=MAX_CONNECTIONS, max_keepalive_connections=MAX_CONNECTIONS),
+            )
+            client = OpenAI(
+                base_url=OPENROUTER_BASE_URL,
+                api_key=api_key,
+                http_client=http_client,
+                max_retries=0,
+            )
+            _clients[api_key] = client
+        return client
+
+
+def _percentile(values: List[float], fraction: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))
+    return round(ordered[index], 4)
+
+
+def get_llm_stats() -> Dict[str, object]:
+    with _stats_lock:
+        counters = dict(_counters)
+        latencies = list(_latencies)
+    return {
+        **counters,
+        "breaker": _breaker.snapshot(),
+        "batching": _coalescer.stats(),
+        "latency_seconds": {
+            "count": len(latencies),
+            "p50": _percentile(latencies, 0.50),
+            "p95": _percentile(latencies, 0.95),
+            "p99": _percentile(latencies, 0.99),
+        },
+    }
+
+
+def _complete(client: "OpenAI", **request) -> Optional[str]:
+    """Run one chat completion with bounded, jittered retries behind the circuit breaker.
+
+    Returns None when the breaker is open or every attempt failed.
+    """
+    for attempt in range(MAX_RETRIES + 1):
+        if not _breaker.allow():
+            _count("short_circuited")
+            return None
+        if attempt:
+            _count("retries")
+        _count("calls")
+        started = time.monotonic()
         try:
-            import random as _random
-            return _random.sample(DEFAULT_QUESTIONS, k=min(count, len(DEFAULT_QUESTIONS)))
+            completion = client.chat.completions.create(**request)
         except Exception:
-            return DEFAULT_QUESTIONS[:count]
+            _count("failures")
+            _breaker.record_failure()
+            if attempt < MAX_RETRIES:
+                time.sleep(random.uniform(0, RETRY_BACKOFF * (2 ** attempt)))
+            continue
+        finally:
+            with _stats_lock:
+                _latencies.append(time.monotonic() - started)
+        _count("successes")
+        _breaker.record_success()
+        return completion.choices[0].message.content or ""
+    return None
 
-    client = OpenAI(
-        base_url="https://openrouter.ai/api/v1",
-        api_key=api_key,
-    )
 
-    topic_fragment = f" Focus on {topic}." if topic else ""
-    names_fragment = f" between {student1_name} and {student2_name}" if student2_name else f" for {student1_name}"
+FallbackSource = Callable[[int, Optional[str]], List[Dict[str, str]]]
+_fallback_source: Optional[FallbackSource] = None
+
+
+def set_fallback_source(source: Optional[FallbackSource]) -> None:
+    """Draw fallback questions from ``source(count, topic)``, e.g. a compiled question pack.
+
+    ``DEFAULT_QUESTIONS`` are still used whenever the source returns fewer than ``count``.
+    """
+    global _fallback_source
+    _fallback_source = source
+
+
+def _from_source(count: int, topic: Optional[str]) -> Optional[List[Dict[str, str]]]:
+    if _fallback_source is None:
+        return None
+    items = _fallback_source(count, topic)
+    return items[:count] if len(items) >= count else None
+
+
+def _fallback(count: int, topic: Optional[str] = None) -> List[Dict[str, str]]:
+    _count("fallbacks")
+    return _from_source(count, topic) or DEFAULT_QUESTIONS[:count]
 
-    system_prompt = (
-        "You are an assistant that outputs JSON only. Return exactly the requested number of items. "
-        "Each item is an object with keys 'question', 'option1', 'option2'. "
-        "Content must be school-friendly (K-12), positive, inclusive, and age-appropriate. Avoid sensitive or adult themes, "
-        "bullying, cheating, academic dishonesty, violence, politics, religion, or anything that could make students uncomfortable. "
-        "Vary topics (arts, science, reading, sports, hobbies, class activities) and keep options parallel and comparable. "
-        "Do not include numbering, explanations, or any text outside the JSON array."
-    )
 
-    user_prompt = (
+def llm_available() -> bool:
+    """Whether a completion would be attempted now: a key is set and the breaker is not open."""
+    return bool(_api_key()) and _breaker.snapshot()["state"] != CircuitBreaker.OPEN
+
+
+SYSTEM_PROMPT = (
+    "You are an assistant that outputs JSON only. Return exactly the requested number of items. "
+    "Each item is an object with keys 'question', 'option1', 'option2'. "
+    "Content must be school-friendly (K-12), positive, inclusive, and age-appropriate. Avoid sensitive or adult themes, "
+    "bullying, cheating, academic dishonesty, violence, politics, religion, or anything that could make students uncomfortable. "
+    "Vary topics (arts, science, reading, sports, hobbies, class activities) and keep options parallel and comparable. "
+    "Do not include numbering, explanations, or any text outside the JSON array."
+)
+
+
+def _user_prompt(count: int, names_fragment: str, topic: Optional[str]) -> str:
+    topic_fragment = f" Focus on {topic}." if topic else ""
+    return (
         f"Create {count} distinct 'Would you rather' questions{names_fragment}.{topic_fragment} "
         "Ensure no duplicates and keep them light, fun, and educational. "
         "Example of one item: {\n  \"question\": \"Would you rather...\",\n  \"option1\": \"Option A\",\n  \"option2\": \"Option B\"\n}. "
         "Return JSON array only."
     )
 
-    try:
-        completion = client.chat.completions.create(
-            model=model,
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_prompt},
-            ],
-            temperature=0.9,
-            top_p=0.95,
-        )
-        content = completion.choices[0].message.content or ""
-        parsed = _parse_json_response(content)
-        if not parsed:
-            return DEFAULT_QUESTIONS[:count]
-        cleaned: List[Dict[str, str]] = []
-        for item in parsed:
-            q = {
-                "question": str(item.get("question", "Would you rather...")),
-                "option1": str(item.get("option1", "Option 1")),
-                "option2": str(item.get("option2", "Option 2")),
-            }
-            cleaned.append(q)
-            if len(cleaned) >= count:
-                break
-        if not cleaned:
-            return DEFAULT_QUESTIONS[:count]
+
+def _clean_items(parsed: object, limit: int, dedupe: bool = False) -> List[Dict[str, str]]:
+    cleaned: List[Dict[str, str]] = []
+    if not isinstance(parsed, list):
         return cleaned
+    seen = set()
+    for item in parsed:
+        if not isinstance(item, dict):
+            continue
+        q = {
+            "question": str(item.get("question", "Would you rather...")),
+            "option1": str(item.get("option1", "Option 1")),
+            "option2": str(item.get("option2", "Option 2")),
+        }
+        if dedupe:
+            key = tuple(" ".join(value.lower().split()) for value in q.values())
+            if key in seen:
+                continue
+            seen.add(key)
+        cleaned.append(q)
+        if len(cleaned) >= limit:
+            break
+    return cleaned
+
+
+def _request_questions(api_key: str, count: int, names_fragment: str, topic: Optional[str], dedupe: bool = False) -> Optional[List[Dict[str, str]]]:
+    """Ask the provider for ``count`` questions; None means the caller should fall back."""
+    content = _complete(
+        _get_client(api_key),
+        model=os.getenv("OPENROUTER_MODEL", "openai/gpt-4o-mini"),
+        messages=[
+            {"role": "system", "content": SYSTEM_PROMPT},
+            {"role": "user", "content": _user_prompt(count, names_fragment, topic)},
+        ],
+        temperature=0.9,
+        top_p=0.95,
+    )
+    if content is None:
+        return None
+    try:
+        cleaned = _clean_items(_parse_json_response(content), count, dedupe=dedupe)
     except Exception:
-        return DEFAULT_QUESTIONS[:count]
+        cleaned = []
+    if not cleaned:
+        _count("parse_failures")
+        return None
+    return cleaned
+
+
+def _api_key() -> Optional[str]:
+    return os.getenv("OPENROUTER_API_KEY") or os.getenv("OPENAI_API_KEY")
+
+
+def _sample_defaults(count: int, topic: Optional[str] = None) -> List[Dict[str, str]]:
+    return _from_source(count, topic) or random.sample(DEFAULT_QUESTIONS, k=min(count, len(DEFAULT_QUESTIONS)))
+
+
+def generate_questions(student1_name: str, student2_name: Optional[str] = None, count: int = 10, topic: Optional[str] = None, stream: bool = False) -> Union[List[Dict[str, str]], Iterator[Dict[str, str]]]:
+    if stream:
+        return stream_questions(student1_name, student2_name, count=count, topic=topic)
+
+    api_key = _api_key()
+    if not api_key:
+        return _sample_defaults(count, topic)
+
+    names_fragment = f" between {student1_name} and {student2_name}" if student2_name else f" for {student1_name}"
+    cleaned = _request_questions(api_key, count, names_fragment, topic)
+    if cleaned is None:
+        return _fallback(count, topic)
+    return cleaned
+
+
+class IncrementalArrayParser:
+    """Pulls complete objects out of a JSON array that arrives in arbitrary chunks.
+
+    Text before the opening ``[`` (such as a code fence) is ignored, and each
+    top-level ``{...}`` is decoded as soon as its closing brace arrives.
+    """
+
+    def __init__(self) -> None:
+        self._buffer = ""
+        self._pos = 0
+        self._started = False
+        self._depth = 0
+        self._in_string = False
+        self._escaped = False
+        self._object_start = -1
+
+    def feed(self, text: str) -> List[object]:
+        self._buffer += text
+        items: List[object] = []
+        buffer = self._buffer
+        while self._pos < len(buffer):
+            char = buffer[self._pos]
+            if not self._started:
+                if char == "[":
+                    self._started = True
+            elif self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif char == "\\":
+                    self._escaped = True
+                elif char == '"':
+                    self._in_string = False
+            elif char == '"':
+                self._in_string = True
+            elif char == "{":
+                if self._depth == 0:
+                    self._object_start = self._pos
+                self._depth += 1
+            elif char == "}" and self._depth:
+                self._depth -= 1
+                if self._depth == 0:
+                    try:
+                        items.append(json.loads(buffer[self._object_start:self._pos + 1]))
+                    except ValueError:
+                        _count("parse_failures")
+                    self._object_start = -1
+            self._pos += 1
+        if self._depth == 0:
+            # Nothing pending; drop consumed text so the buffer stays small.
+            self._buffer = self._buffer[self._pos:]
+            self._pos = 0
+        return items
+
+
+def stream_questions(student1_name: str, student2_name: Optional[str] = None, count: int = 10, topic: Optional[str] = None) -> Iterator[Dict[str, str]]:
+    """Yield validated questions one at a time as the completion streams in.
 
-__all__ = ["generate_questions"]
+    If the stream fails or ends early, the remaining slots are filled from the
+    fallback questions, so callers always receive ``count`` items.
+    """
+    api_key = _api_key()
+    if not api_key:
+        yield from _sample_defaults(count, topic)
+        return
+
+    names_fragment = f" between {student1_name} and {student2_name}" if student2_name else f" for {student1_name}"
+    delivered = 0
+    seen = set()
+    if _breaker.allow():
+        _count("calls")
+        started = time.monotonic()
+        parser = IncrementalArrayParser()
+        try:
+            response = _get_client(api_key).chat.completions.create(
+                model=os.getenv("OPENROUTER_MODEL", "openai/gpt-4o-mini"),
+                messages=[
+                    {"role": "system", "content": SYSTEM_PROMPT},
+                    {"role": "user", "content": _user_prompt(count, names_fragment, topic)},
+                ],
+                temperature=0.9,
+                top_p=0.95,
+                stream=True,
+            )
+            for chunk in response:
+                if not chunk.choices:
+                    continue
+                for item in _clean_items(parser.feed(chunk.choices[0].delta.content or ""), count):
+                    key = tuple(" ".join(value.lower().split()) for value in item.values())
+                    if key in seen:
+                        continue
+                    seen.add(key)
+                    delivered += 1
+                    yield item
+                    if delivered >= count:
+                        break
+                if delivered >= count:
+                    response.close()
+                    break
+        except GeneratorExit:
+            # The consumer stopped after at least one item, so the provider answered. Recording
+            # it also ends a half-open probe, which would otherwise stay in flight for good.
+            response.close()
+            _count("successes")
+            _breaker.record_success()
+            raise
+        except Exception:
+            _count("failures")
+            _breaker.record_failure()
+        else:
+            _count("successes")
+            _breaker.record_success()
+            if delivered == 0:
+                _count("parse_failures")
+        finally:
+            with _stats_lock:
+                _latencies.append(time.monotonic() - started)
+    else:
+        _count("short_circuited")
+
+    if delivered < count:
+        for item in _fallback(len(DEFAULT_QUESTIONS), topic):
+            key = tuple(" ".join(value.lower().split()) for value in item.values())
+            if key in seen:
+                continue
+            seen.add(key)
+            delivered += 1
+            yield item
+            if delivered >= count:
+                break
+
+
+class _Batch:
+    def __init__(self) -> None:
+        self.counts: List[int] = []
+        self.total = 0
+        self.full = threading.Event()
+        self.done = threading.Event()
+        self.results: List[List[Dict[str, str]]] = []
+
+
+class BatchCoalescer:
+    """Merges generation requests that arrive within ``window`` seconds into one completion.
+
+    The first caller of a batch waits out the window (or until the batch holds
+    ``max_questions``), asks the provider once for the combined count, then splits
+    the deduplicated result between callers in arrival order. Callers left short
+    are topped up from the fallback questions.
+    """
+
+    def __init__(self, window: float, max_questions: int) -> None:
+        self.window = window
+        self.max_questions = max(1, max_questions)
+        self._lock = threading.Lock()
+        self._open: Dict[Optional[str], _Batch] = {}
+        self._counters = {"requests": 0, "batches": 0, "questions_requested": 0}
+
+    def request(self, count: int, topic: Optional[str] = None) -> List[Dict[str, str]]:
+        with self._lock:
+            self._counters["requests"] += 1
+            batch = self._open.get(topic)
+            leader = batch is None or batch.total + count > self.max_questions
+            if leader:
+                batch = _Batch()
+                self._open[topic] = batch
+            slot = len(batch.counts)
+            batch.counts.append(count)
+            batch.total += count
+            if batch.total >= self.max_questions:
+                self._open.pop(topic, None)
+                batch.full.set()
+
+        if leader:
+            batch.full.wait(self.window)
+            with self._lock:
+                if self._open.get(topic) is batch:
+                    del self._open[topic]
+                self._counters["batches"] += 1
+                self._counters["questions_requested"] += batch.total
+            try:
+                self._run(batch, topic)
+            finally:
+                batch.done.set()
+        else:
+            batch.done.wait()
+        if slot < len(batch.results):
+            return batch.results[slot]
+        return _fallback(count, topic)
+
+    def _run(self, batch: _Batch, topic: Optional[str]) -> None:
+        api_key = _api_key()
+        if not api_key:
+            batch.results = [_sample_defaults(count, topic) for count in batch.counts]
+            return
+        generated = _request_questions(api_key, batch.total, " for a class of students", topic, dedupe=True) or []
+        offset = 0
+        for count in batch.counts:
+            chunk = generated[offset:offset + count]
+            offset += count
+            if len(chunk) < count:
+                chunk = chunk + _fallback(count - len(chunk), topic)
+            batch.results.append(chunk)
+
+    def stats(self) -> Dict[str, object]:
+        with self._lock:
+            counters = dict(self._counters)
+        batches = counters["batches"]
+        return {
+            **counters,
+            "requests_per_batch": round(counters["requests"] / batches, 2) if batches else None,
+        }
+
+
+_coalescer = BatchCoalescer(
+    float(os.getenv("OPENROUTER_BATCH_WINDOW", "0.05")),
+    int(os.getenv("OPENROUTER_BATCH_MAX_QUESTIONS", "100")),
+)
+
+
+def generate_question_batch(count: int = 10, topic: Optional[str] = None) -> List[Dict[str, str]]:
+    """Generate non-personalised questions, sharing one completion with concurrent callers."""
+    return _coalescer.request(count, topic)
+
+def request_questions(count: int = 10, topic: Optional[str] = None) -> List[Dict[str, str]]:
+    """Only what the LLM returned: an empty list when there is no key or the request fails, never fallbacks."""
+    api_key = _api_key()
+    if not api_key:
+        return []
+    return _request_questions(api_key, count, "", topic, dedupe=True) or []
+
+__all__ = [
+    "generate_questions",
+    "generate_question_batch",
+    "request_questions",
+    "stream_questions",
+    "get_llm_stats",
+    "llm_available",
+    "set_fallback_source",
+]
@@ -0,0 +1,204 @@
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from queue import Empty, Full, Queue
+from typing import Callable, Deque, Dict, List, Optional
+
+QuestionSet = List[Dict[str, str]]
+
+
+def validate_question_set(items: object, size: int) -> Optional[QuestionSet]:
+    if not isinstance(items, list) or len(items) < size:
+        return None
+    cleaned: QuestionSet = []
+    seen = set()
+    for item in items:
+        if not isinstance(item, dict):
+            continue
+        question = str(item.get("question", "")).strip()
+        option1 = str(item.get("option1", "")).strip()
+        option2 = str(item.get("option2", "")).strip()
+        if not question or not option1 or not option2 or option1 == option2:
+            continue
+        key = (option1.lower(), option2.lower())
+        if key in seen:
+            continue
+        seen.add(key)
+        cleaned.append({"question": question, "option1": option1, "option2": option2})
+        if len(cleaned) == size:
+            return cleaned
+    return None
+
+
+class QuestionPool:
+    """Keeps a bounded buffer of ready question sets filled ahead of demand."""
+
+    def __init__(
+        self,
+        generator: Callable[..., QuestionSet],
+        set_size: int = 10,
+        depth: int = 8,
+        workers: int = 2,
+        refill_interval: float = 0.0,
+        personalise_workers: int = 2,
+        refill_generator: Optional[Callable[..., QuestionSet]] = None,
+        max_sets_per_refill: int = 4,
+    ) -> None:
+        self.generator = generator
+        self.refill_generator = refill_generator
+        self.max_sets_per_refill = max(1, max_sets_per_refill)
+        self.set_size = set_size
+        self.depth = max(1, depth)
+        self.workers = max(1, workers)
+        self.refill_interval = max(0.0, refill_interval)
+        self.personalise_workers = max(1, personalise_workers)
+
+        self._buffer: "Queue[QuestionSet]" = Queue(maxsize=self.depth)
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._threads: List[threading.Thread] = []
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._refills: Deque[float] = deque(maxlen=100)
+        self._counters = {
+            "hits": 0,
+            "misses": 0,
+            "produced": 0,
+            "rejected": 0,
+            "errors": 0,
+            "personalised": 0,
+            "personalise_failed": 0,
+        }
+
+    def start(self) -> None:
+        with self._lock:
+            if self._threads:
+                return
+            self._stop.clear()
+            for index in range(self.workers):
+                thread = threading.Thread(
+                    target=self._refill_loop,
+                    name=f"question-pool-{index}",
+                    daemon=True,
+                )
+                thread.start()
+                self._threads.append(thread)
+
+    def stop(self, timeout: float = 1.0) -> None:
+        self._stop.set()
+        with self._lock:
+            threads, self._threads = self._threads, []
+            executor, self._executor = self._executor, None
+        for thread in threads:
+            thread.join(timeout)
+        if executor is not None:
+            executor.shutdown(wait=False)
+
+    def take(self) -> Optional[QuestionSet]:
+        self.start()
+        try:
+            question_set = self._buffer.get_nowait()
+        except Empty:
+            self._count("misses")
+            return None
+        self._count("hits")
+        return question_set
+
+    def personalise(
+        self,
+        student1_name: str,
+        student2_name: Optional[str],
+        callback: Callable[[QuestionSet], None],
+    ) -> None:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.personalise_workers,
+                    thread_name_prefix="question-personalise",
+                )
+            executor = self._executor
+        executor.submit(self._personalise, student1_name, student2_name, callback)
+
+    def stats(self) -> Dict[str, object]:
+        now = time.monotonic()
+        with self._lock:
+            counters = dict(self._counters)
+            recent = [t for t in self._refills if now - t <= 60.0]
+        requests = counters["hits"] + counters["misses"]
+        return {
+            "depth": self._buffer.qsize(),
+            "capacity": self.depth,
+            "workers": self.workers,
+            "running": bool(self._threads),
+            "refills_per_minute": len(recent),
+            "hit_rate": round(counters["hits"] / requests, 3) if requests else None,
+            **counters,
+        }
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            self._counters[name] += 1
+
+    def _generate(self, *args: Optional[str]) -> Optional[QuestionSet]:
+        try:
+            generated = self.generator(*args, count=self.set_size)
+        except Exception:
+            self._count("errors")
+            return None
+        question_set = validate_question_set(generated, self.set_size)
+        if question_set is None:
+            self._count("rejected")
+        return question_set
+
+    def _generate_sets(self, wanted: int) -> List[QuestionSet]:
+        if self.refill_generator is None:
+            question_set = self._generate("the class", None)
+            return [question_set] if question_set is not None else []
+        try:
+            generated = self.refill_generator(count=self.set_size * wanted)
+        except Exception:
+            self._count("errors")
+            return []
+        question_sets = []
+        for start in range(0, self.set_size * wanted, self.set_size):
+            question_set = validate_question_set(generated[start:start + self.set_size], self.set_size)
+            if question_set is None:
+                self._count("rejected")
+            else:
+                question_sets.append(question_set)
+        return question_sets
+
+    def _refill_loop(self) -> None:
+        while not self._stop.is_set():
+            wanted = min(self.max_sets_per_refill, max(1, self.depth - self._buffer.qsize()))
+            question_sets = self._generate_sets(wanted)
+            for question_set in question_sets:
+                while not self._stop.is_set():
+                    try:
+                        self._buffer.put(question_set, timeout=0.5)
+                    except Full:
+                        continue
+                    with self._lock:
+                        self._counters["produced"] += 1
+                        self._refills.append(time.monotonic())
+                    break
+            if not question_sets and self._stop.wait(1.0):
+                break
+            if self.refill_interval:
+                self._stop.wait(self.refill_interval)
+
+    def _personalise(
+        self,
+        student1_name: str,
+        student2_name: Optional[str],
+        callback: Callable[[QuestionSet], None],
+    ) -> None:
+        question_set = self._generate(student1_name, student2_name)
+        if question_set is None:
+            self._count("personalise_failed")
+            return
+        self._count("personalised")
+        callback(question_set)
+
+
+__all__ = ["QuestionPool", "validate_question_set"]
@@ -0,0 +1,84 @@
+import hashlib
+import os
+import re
+from datetime import datetime, timedelta
+
+from sqlalchemy import or_
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from models import db, Question
+
+REUSE_AFTER = timedelta(seconds=int(os.getenv('QUESTION_BANK_REUSE_AFTER', '3600')))
+
+_whitespace = re.compile(r'\s+')
+
+def _normalise(value):
+    return _whitespace.sub(' ', str(value)).strip()
+
+def content_hash(item):
+    key = '\x1f'.join(_normalise(item.get(field, '')).lower() for field in ('question', 'option1', 'option2'))
+    return hashlib.sha256(key.encode('utf-8')).hexdigest()
+
+def store_questions(items):
+    """Add items to the bank, skipping ones already stored, and return their ids in order."""
+    rows = {}
+    for item in items:
+        digest = content_hash(item)
+        rows.setdefault(digest, {
+            'content_hash': digest,
+            'question': _normalise(item.get('question', '')),
+            'option1': _normalise(item.get('option1', '')),
+            'option2': _normalise(item.get('option2', '')),
+            'use_count': 0,
+            'created_at': datetime.utcnow(),
+        })
+    if not rows:
+        return []
+    db.session.execute(
+        sqlite_insert(Question).values(list(rows.values())).on_conflict_do_nothing(index_elements=['content_hash'])
+    )
+    ids = dict(
+        db.session.query(Question.content_hash, Question.id).filter(Question.content_hash.in_(rows)).all()
+    )
+    return [ids[content_hash(item)] for item in items]
+
+def load_questions(ids):
+    if not ids:
+        return []
+    by_id = {q.id: q for q in Question.query.filter(Question.id.in_(ids)).all()}
+    return [by_id[i].to_dict() for i in ids if i in by_id]
+
+def mark_used(ids):
+    if not ids:
+        return
+    Question.query.filter(Question.id.in_(ids)).update(
+        {Question.last_used_at: datetime.utcnow(), Question.use_count: Question.use_count + 1},
+        synchronize_session=False,
+    )
+
+def draw_question_set(size, fresh_source):
+    """Pick the least recently used questions not shown within REUSE_AFTER.
+
+    When the bank cannot fill a set on its own, ``fresh_source`` is asked for a new
+    set which is added to the bank, so the bank only grows when demand outpaces reuse.
+    Returns ``(ids, questions)``, or None when ``fresh_source`` has nothing ready.
+    """
+    cutoff = datetime.utcnow() - REUSE_AFTER
+    eligible = (
+        Question.query
+        .filter(or_(Question.last_used_at.is_(None), Question.last_used_at < cutoff))
+        .order_by(Question.last_used_at.asc().nullsfirst(), Question.use_count.asc(), Question.id.asc())
+        .limit(size)
+        .all()
+    )
+    if len(eligible) >= size:
+        ids = [q.id for q in eligible]
+        selected = [q.to_dict() for q in eligible]
+    else:
+        fresh = fresh_source()
+        if fresh is None:
+            return None
+        selected = fresh[:size]
+        ids = store_questions(selected)
+    mark_used(ids)
+    return ids, selected
@@ -0,0 +1,181 @@
+import json
+import os
+import random
+import sqlite3
+import threading
+from bisect import bisect_right
+from datetime import datetime
+
+from question_bank import content_hash
+
+PACK_FORMAT = 1
+DEFAULT_TOPIC = 'general'
+
+_SCHEMA = """
+CREATE TABLE topic (id INTEGER PRIMARY KEY, name TEXT NOT NULL UNIQUE, first_id INTEGER NOT NULL, size INTEGER NOT NULL);
+CREATE TABLE question (id INTEGER PRIMARY KEY, question TEXT NOT NULL, option1 TEXT NOT NULL, option2 TEXT NOT NULL);
+CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+"""
+
+
+class PackError(Exception):
+    pass
+
+
+def clean_item(item, default_topic=DEFAULT_TOPIC):
+    """Return ``(topic, question)`` for a usable pack entry, or None."""
+    if not isinstance(item, dict):
+        return None
+    question = ' '.join(str(item.get('question', '')).split())
+    option1 = ' '.join(str(item.get('option1', '')).split())
+    option2 = ' '.join(str(item.get('option2', '')).split())
+    if not question or not option1 or not option2 or option1.lower() == option2.lower():
+        return None
+    topic = ' '.join(str(item.get('topic') or default_topic).split()).lower()
+    return topic, {'question': question, 'option1': option1, 'option2': option2}
+
+
+def read_source(path, default_topic=DEFAULT_TOPIC):
+    """Read authored questions from ``path``.
+
+    Accepts a JSON list of items, a JSON object mapping topics to lists, or JSON
+    lines. Items carry ``question``, ``option1``, ``option2`` and optionally ``topic``.
+    """
+    with open(path, encoding='utf-8') as handle:
+        if path.endswith('.jsonl'):
+            data = [json.loads(line) for line in handle if line.strip()]
+        else:
+            data = json.load(handle)
+    if isinstance(data, dict):
+        data = [dict(item, topic=topic) for topic, items in data.items() for item in items]
+    if not isinstance(data, list):
+        raise PackError(f'{path}: expected a list of questions or an object of topics')
+    return [dict(item, topic=item.get('topic') or default_topic) for item in data if isinstance(item, dict)]
+
+
+def compile_pack(items, path):
+    """Write ``items`` to a pack at ``path`` and return ``{topic: count}``.
+
+    Duplicates (by question-bank content hash) and malformed items are dropped.
+    Each topic's questions get consecutive ids, so sampling a topic is picking
+    numbers from a range. The pack is written next to ``path`` and moved into
+    place, so a running server never sees a half-written file.
+    """
+    by_topic = {}
+    seen = set()
+    for item in items:
+        cleaned = clean_item(item)
+        if cleaned is None:
+            continue
+        topic, question = cleaned
+        digest = content_hash(question)
+        if digest in seen:
+            continue
+        seen.add(digest)
+        by_topic.setdefault(topic, []).append(question)
+    if not by_topic:
+        raise PackError('No usable questions to compile')
+
+    temporary = f'{path}.tmp'
+    if os.path.exists(temporary):
+        os.remove(temporary)
+    connection = sqlite3.connect(temporary)
+    try:
+        connection.executescript(_SCHEMA)
+        next_id = 1
+        for topic_id, topic in enumerate(sorted(by_topic), start=1):
+            questions = by_topic[topic]
+            connection.execute(
+                'INSERT INTO topic (id, name, first_id, size) VALUES (?, ?, ?, ?)',
+                (topic_id, topic, next_id, len(questions)),
+            )
+            connection.executemany(
+                'INSERT INTO question (id, question, option1, option2) VALUES (?, ?, ?, ?)',
+                [(next_id + offset, q['question'], q['option1'], q['option2']) for offset, q in enumerate(questions)],
+            )
+            next_id += len(questions)
+        connection.executemany('INSERT INTO meta (key, value) VALUES (?, ?)', [
+            ('compiled_at', datetime.utcnow().isoformat()),
+            ('questions', str(next_id - 1)),
+        ])
+        connection.execute(f'PRAGMA user_version={PACK_FORMAT}')
+        connection.commit()
+        connection.execute('VACUUM')
+    finally:
+        connection.close()
+    os.replace(temporary, path)
+    return {topic: len(questions) for topic, questions in sorted(by_topic.items())}
+
+
+class QuestionPack:
+    """A compiled pack opened read-only and memory-mapped.
+
+    Topic ranges are held in memory, so ``sample`` picks ids without touching the
+    file and then reads exactly those rows by primary key.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._connection = sqlite3.connect(f'file:{path}?mode=ro&immutable=1', uri=True, check_same_thread=False)
+        self._lock = threading.Lock()
+        if self._connection.execute('PRAGMA user_version').fetchone()[0] != PACK_FORMAT:
+            self._connection.close()
+            raise PackError(f'{path} is not a version {PACK_FORMAT} question pack')
+        self._connection.execute(f'PRAGMA mmap_size={os.path.getsize(path)}')
+        self.topics = {
+            name: (first_id, size)
+            for name, first_id, size in self._connection.execute('SELECT name, first_id, size FROM topic ORDER BY id')
+        }
+        self._counters = {'samples': 0, 'sampled': 0, 'short': 0}
+
+    def __len__(self):
+        return sum(size for _, size in self.topics.values())
+
+    def sample(self, count, topics=None):
+        """Up to ``count`` distinct questions from ``topics`` (all topics when empty), weighted by topic size."""
+        ranges = [self.topics[topic] for topic in (topics or self.topics) if topic in self.topics]
+        starts, total = [], 0
+        for _, size in ranges:
+            starts.append(total)
+            total += size
+        picks = random.sample(range(total), min(count, total)) if total else []
+        ids = []
+        for pick in picks:
+            index = bisect_right(starts, pick) - 1
+            ids.append(ranges[index][0] + pick - starts[index])
+        rows = {}
+        if ids:
+            with self._lock:
+                rows = {
+                    row[0]: {'question': row[1], 'option1': row[2], 'option2': row[3]}
+                    for row in self._connection.execute(
+                        f"SELECT id, question, option1, option2 FROM question WHERE id IN ({','.join('?' * len(ids))})",
+                        ids,
+                    )
+                }
+        with self._lock:
+            self._counters['samples'] += 1
+            self._counters['sampled'] += len(rows)
+            self._counters['short'] += int(len(rows) < count)
+        return [rows[question_id] for question_id in ids if question_id in rows]
+
+    def stats(self):
+        with self._lock:
+            counters = dict(self._counters)
+        return {
+            'path': self.path,
+            'questions': len(self),
+            'topics': {name: size for name, (_, size) in self.topics.items()},
+            **counters,
+        }
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+
+def load_pack(path):
+    """Open the pack at ``path``, or return None when there is none."""
+    if not path or not os.path.exists(path):
+        return None
+    return QuestionPack(path)
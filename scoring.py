@@ -0,0 +1,68 @@
+# NumPy is imported inside the functions: it is only needed once a game completes,
+# and importing it with the app would slow down every worker start.
+
+POINTS_PER_MATCH = 10
+
+
+def answer_matrix(answers, participant_numbers, question_count):
+    """Participants x questions matrix of answers (1 or 2), with 0 where a question is unanswered."""
+    import numpy as np
+
+    matrix = np.zeros((len(participant_numbers), question_count), dtype=np.int8)
+    for row, number in enumerate(participant_numbers):
+        given = answers.get(number, [])[:question_count]
+        matrix[row, :len(given)] = given
+    return matrix
+
+
+def agreement_matrix(matrix):
+    """Number of questions on which each pair of participants chose the same option."""
+    import numpy as np
+
+    chose_first = (matrix == 1).astype(np.int32)
+    chose_second = (matrix == 2).astype(np.int32)
+    return chose_first @ chose_first.T + chose_second @ chose_second.T
+
+
+def participant_scores(agreement, points=POINTS_PER_MATCH):
+    """Average agreement with every other participant, in points; for two players this is matches * points."""
+    import numpy as np
+
+    size = agreement.shape[0]
+    if size < 2:
+        return np.zeros(size, dtype=int)
+    with_others = agreement.sum(axis=1) - np.diag(agreement)
+    return np.rint(with_others * points / (size - 1)).astype(int)
+
+
+def closest_pairs(agreement):
+    """Each participant's best-matching partner as ``(row, other_row, matches)``, one entry per pair."""
+    import numpy as np
+
+    if agreement.shape[0] < 2:
+        return []
+    masked = agreement.astype(np.int64)
+    np.fill_diagonal(masked, -1)
+    pairs = {}
+    for row, other in enumerate(masked.argmax(axis=1)):
+        pair = (min(row, int(other)), max(row, int(other)))
+        pairs[pair] = int(agreement[pair])
+    return [(row, other, matches) for (row, other), matches in sorted(pairs.items())]
+
+
+def option_counts(matrix):
+    """How many participants chose option 1, and option 2, on each question."""
+    return (matrix == 1).sum(axis=0), (matrix == 2).sum(axis=0)
+
+
+def pair_totals(matrix, agreement):
+    """``(pairs, matching, compared)`` over every pair of participants.
+
+    ``matching`` sums the answers each pair agreed on and ``compared`` the questions both answered.
+    """
+    import numpy as np
+
+    answered = (matrix > 0).astype(np.int32)
+    both = answered @ answered.T
+    upper = np.triu_indices(matrix.shape[0], k=1)
+    return len(upper[0]), int(agreement[upper].sum()), int(both[upper].sum())
@@ -0,0 +1,91 @@
+import random
+import threading
+import time
+from collections import deque
+
+
+class CodesExhausted(Exception):
+    pass
+
+
+class CodeAllocator:
+    """Hands out session codes from a precomputed, shuffled free pool.
+
+    ``load_used`` returns the codes currently taken and is called to build the
+    pool. ``reclaim`` frees codes held by finished or expired sessions and
+    returns them; it runs when the pool is empty, or when it drops below the
+    low-water mark, at most once per ``reclaim_interval`` seconds. When a reclaim
+    frees nothing the pool is rebuilt from ``load_used``, which picks up codes
+    freed elsewhere (the maintenance command, other workers). Released codes go
+    to the back of the queue so a just-finished game's code is reused last.
+    """
+
+    def __init__(self, load_used, reclaim, length=3, prefix='', low_water=0.1, reclaim_interval=30.0):
+        self.load_used = load_used
+        self.reclaim = reclaim
+        self.length = length
+        self.prefix = prefix
+        self.low_water = max(1, int(self.capacity * low_water))
+        self.reclaim_interval = reclaim_interval
+        self._lock = threading.Lock()
+        self._free = None
+        self._free_set = set()
+        self._last_reclaim = 0.0
+
+    @property
+    def capacity(self):
+        return 10 ** self.length
+
+    def all_codes(self):
+        return [f'{self.prefix}{number:0{self.length}d}' for number in range(self.capacity)]
+
+    def owns(self, code):
+        digits = code[len(self.prefix):]
+        return code.startswith(self.prefix) and len(digits) == self.length and digits.isdigit()
+
+    def _ensure_loaded(self):
+        if self._free is None:
+            used = set(self.load_used())
+            codes = [code for code in self.all_codes() if code not in used]
+            random.shuffle(codes)
+            self._free = deque(codes)
+            self._free_set = set(codes)
+
+    def _reclaim(self, force):
+        now = time.monotonic()
+        if not force and now - self._last_reclaim < self.reclaim_interval:
+            return
+        self._last_reclaim = now
+        reclaimed = list(self.reclaim())
+        for code in reclaimed:
+            self.release(code)
+        if not reclaimed:
+            with self._lock:
+                self._free = None
+                self._ensure_loaded()
+
+    def allocate(self):
+        with self._lock:
+            self._ensure_loaded()
+            free_count = len(self._free)
+        if free_count <= self.low_water:
+            self._reclaim(force=free_count == 0)
+        with self._lock:
+            if not self._free:
+                raise CodesExhausted(f'All {self.capacity} session codes are in use')
+            code = self._free.popleft()
+            self._free_set.discard(code)
+            return code
+
+    def release(self, code):
+        if not self.owns(code):
+            return
+        with self._lock:
+            if self._free is not None and code not in self._free_set:
+                self._free.append(code)
+                self._free_set.add(code)
+
+    def stats(self):
+        with self._lock:
+            free = len(self._free) if self._free is not None else None
+        return {'capacity': self.capacity, 'free': free, 'prefix': self.prefix, 'length': self.length}
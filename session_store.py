@@ -0,0 +1,207 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+
+
+class SessionStore(ABC):
+    """Cache of live session payloads keyed by session code.
+
+    Entries expire ``ttl`` seconds after they were last read or written; ``set``
+    accepts a per-entry ttl so finished games can be dropped sooner.
+    """
+
+    def __init__(self, ttl=3600):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._counters = {'hits': 0, 'misses': 0, 'sets': 0, 'evictions': 0, 'expirations': 0}
+
+    @abstractmethod
+    def get(self, code):
+        raise NotImplementedError
+
+    @abstractmethod
+    def set(self, code, data, ttl=None):
+        raise NotImplementedError
+
+    @abstractmethod
+    def delete(self, code):
+        raise NotImplementedError
+
+    @abstractmethod
+    def clear(self):
+        raise NotImplementedError
+
+    @abstractmethod
+    def __len__(self):
+        raise NotImplementedError
+
+    def __contains__(self, code):
+        return self.get(code) is not None
+
+    def _count(self, name, amount=1):
+        with self._lock:
+            self._counters[name] += amount
+
+    def stats(self):
+        with self._lock:
+            counters = dict(self._counters)
+        lookups = counters['hits'] + counters['misses']
+        return {
+            'backend': self.backend,
+            'size': len(self),
+            'ttl': self.ttl,
+            'hit_rate': round(counters['hits'] / lookups, 3) if lookups else None,
+            **counters,
+        }
+
+
+class MemorySessionStore(SessionStore):
+    backend = 'memory'
+
+    def __init__(self, max_entries=1000, ttl=3600):
+        super().__init__(ttl)
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+
+    def get(self, code):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(code)
+            if entry is None:
+                self._counters['misses'] += 1
+                return None
+            data, ttl, expires_at = entry
+            if expires_at <= now:
+                del self._entries[code]
+                self._counters['expirations'] += 1
+                self._counters['misses'] += 1
+                return None
+            self._entries[code] = (data, ttl, now + ttl)
+            self._entries.move_to_end(code)
+            self._counters['hits'] += 1
+            return data
+
+    def set(self, code, data, ttl=None):
+        ttl = self.ttl if ttl is None else ttl
+        with self._lock:
+            self._entries[code] = (data, ttl, time.monotonic() + ttl)
+            self._entries.move_to_end(code)
+            self._counters['sets'] += 1
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._counters['evictions'] += 1
+
+    def delete(self, code):
+        with self._lock:
+            self._entries.pop(code, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self):
+        return dict(super().stats(), max_entries=self.max_entries)
+
+
+class SQLiteSessionStore(SessionStore):
+    """Session cache shared by every worker process through a WAL-mode SQLite file."""
+
+    backend = 'sqlite'
+    purge_every = 100
+
+    def __init__(self, path, max_entries=10000, ttl=3600):
+        super().__init__(ttl)
+        self.path = path
+        self.max_entries = max_entries
+        self._local = threading.local()
+        self._writes = 0
+        with self._connect() as connection:
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS session_cache ('
+                'code TEXT PRIMARY KEY, data TEXT NOT NULL, ttl REAL NOT NULL, expires_at REAL NOT NULL)'
+            )
+            connection.execute('CREATE INDEX IF NOT EXISTS ix_session_cache_expires_at ON session_cache (expires_at)')
+
+    def _connect(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=5.0, isolation_level=None)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            self._local.connection = connection
+        return connection
+
+    def get(self, code):
+        now = time.time()
+        connection = self._connect()
+        row = connection.execute(
+            'SELECT data, ttl, expires_at FROM session_cache WHERE code = ?', (code,)
+        ).fetchone()
+        if row is None:
+            self._count('misses')
+            return None
+        data, ttl, expires_at = row
+        if expires_at <= now:
+            connection.execute('DELETE FROM session_cache WHERE code = ? AND expires_at <= ?', (code, now))
+            self._count('expirations')
+            self._count('misses')
+            return None
+        connection.execute('UPDATE session_cache SET expires_at = ? WHERE code = ?', (now + ttl, code))
+        self._count('hits')
+        return json.loads(data)
+
+    def set(self, code, data, ttl=None):
+        ttl = self.ttl if ttl is None else ttl
+        connection = self._connect()
+        connection.execute(
+            'INSERT OR REPLACE INTO session_cache (code, data, ttl, expires_at) VALUES (?, ?, ?, ?)',
+            (code, json.dumps(data), ttl, time.time() + ttl),
+        )
+        self._count('sets')
+        with self._lock:
+            self._writes += 1
+            purge = self._writes % self.purge_every == 0
+        if purge:
+            self.purge()
+
+    def delete(self, code):
+        self._connect().execute('DELETE FROM session_cache WHERE code = ?', (code,))
+
+    def clear(self):
+        self._connect().execute('DELETE FROM session_cache')
+
+    def purge(self):
+        connection = self._connect()
+        expired = connection.execute('DELETE FROM session_cache WHERE expires_at <= ?', (time.time(),)).rowcount
+        evicted = connection.execute(
+            'DELETE FROM session_cache WHERE code IN ('
+            'SELECT code FROM session_cache ORDER BY expires_at DESC LIMIT -1 OFFSET ?)',
+            (self.max_entries,),
+        ).rowcount
+        self._count('expirations', expired)
+        self._count('evictions', evicted)
+
+    def __len__(self):
+        return self._connect().execute('SELECT COUNT(*) FROM session_cache').fetchone()[0]
+
+    def stats(self):
+        return dict(super().stats(), max_entries=self.max_entries, path=self.path)
+
+
+def create_session_store(instance_path):
+    backend = os.getenv('SESSION_STORE', 'memory')
+    ttl = float(os.getenv('SESSION_STORE_TTL', '3600'))
+    max_entries = int(os.getenv('SESSION_STORE_MAX_ENTRIES', '1000'))
+    if backend == 'sqlite':
+        path = os.getenv('SESSION_STORE_PATH', os.path.join(instance_path, 'sessions.db'))
+        return SQLiteSessionStore(path, max_entries=max_entries, ttl=ttl)
+    if backend != 'memory':
+        raise ValueError(f'Unknown SESSION_STORE backend: {backend}')
+    return MemorySessionStore(max_entries=max_entries, ttl=ttl)
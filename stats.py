@@ -0,0 +1,155 @@
+from collections import defaultdict
+from datetime import datetime
+
+from sqlalchemy import func
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from models import db, Answer, GameRollup, GameSession, Participant, Question, QuestionStats
+import scoring
+
+QUESTION_SORTS = {
+    'divisive': QuestionStats.split_rate,
+    'option1': QuestionStats.option1_rate,
+    'answers': QuestionStats.answers,
+}
+
+def _rate(count, total):
+    return count * 1.0 / func.nullif(total, 0)
+
+def record_game(game_session_db, participants, matrix, agreement):
+    """Add a completed game to the daily and per-question aggregates in the caller's transaction.
+
+    ``matrix`` and ``agreement`` are the ones the game was scored with. Games already
+    recorded are skipped, so this is safe to call again from backfill or archival.
+    """
+    if game_session_db.stats_recorded:
+        return
+    question_ids = game_session_db.get_question_ids()[:matrix.shape[1]]
+    option1, option2 = scoring.option_counts(matrix)
+    rows = []
+    for index, question_id in enumerate(question_ids):
+        first, second = int(option1[index]), int(option2[index])
+        answers = first + second
+        if answers:
+            rows.append({
+                'question_id': question_id,
+                'answers': answers,
+                'option1_count': first,
+                'pairs': answers * (answers - 1) // 2,
+                'split_pairs': first * second,
+                'option1_rate': first / answers,
+                'split_rate': first * second / (answers * (answers - 1) // 2) if answers > 1 else None,
+            })
+    if rows:
+        statement = sqlite_insert(QuestionStats).values(rows)
+        answers = QuestionStats.answers + statement.excluded.answers
+        pairs = QuestionStats.pairs + statement.excluded.pairs
+        db.session.execute(statement.on_conflict_do_update(
+            index_elements=['question_id'],
+            set_={
+                'answers': answers,
+                'option1_count': QuestionStats.option1_count + statement.excluded.option1_count,
+                'pairs': pairs,
+                'split_pairs': QuestionStats.split_pairs + statement.excluded.split_pairs,
+                'option1_rate': _rate(QuestionStats.option1_count + statement.excluded.option1_count, answers),
+                'split_rate': _rate(QuestionStats.split_pairs + statement.excluded.split_pairs, pairs),
+            },
+        ))
+
+    pairs, matching, compared = scoring.pair_totals(matrix, agreement)
+    scores = [participant.score or 0 for participant in participants]
+    completed_at = game_session_db.completed_at or game_session_db.created_at or datetime.utcnow()
+    statement = sqlite_insert(GameRollup).values(
+        day=completed_at.date(),
+        games=1,
+        participants=len(participants),
+        answers=int((matrix > 0).sum()),
+        total_score=sum(scores),
+        best_score=max(scores, default=0),
+        pairs=pairs,
+        matching_answers=matching,
+        compared_answers=compared,
+    )
+    db.session.execute(statement.on_conflict_do_update(
+        index_elements=['day'],
+        set_={
+            'games': GameRollup.games + statement.excluded.games,
+            'participants': GameRollup.participants + statement.excluded.participants,
+            'answers': GameRollup.answers + statement.excluded.answers,
+            'total_score': GameRollup.total_score + statement.excluded.total_score,
+            'best_score': func.max(GameRollup.best_score, statement.excluded.best_score),
+            'pairs': GameRollup.pairs + statement.excluded.pairs,
+            'matching_answers': GameRollup.matching_answers + statement.excluded.matching_answers,
+            'compared_answers': GameRollup.compared_answers + statement.excluded.compared_answers,
+        },
+    ))
+    game_session_db.stats_recorded = True
+
+def record_sessions(sessions):
+    """Record completed games loaded from the database, rebuilding their matrices from stored answers."""
+    sessions = [session for session in sessions if not session.stats_recorded]
+    if not sessions:
+        return 0
+    codes = [session.code for session in sessions]
+    participants = defaultdict(list)
+    for participant in Participant.query.filter(Participant.session_code.in_(codes)).order_by(Participant.number):
+        participants[participant.session_code].append(participant)
+    answers = defaultdict(lambda: defaultdict(list))
+    rows = (
+        db.session.query(Answer.session_code, Answer.student_number, Answer.answer)
+        .filter(Answer.session_code.in_(codes))
+        .order_by(Answer.session_code, Answer.student_number, Answer.question_index)
+    )
+    for session_code, student_number, answer in rows:
+        answers[session_code][student_number].append(answer)
+
+    for session in sessions:
+        players = participants[session.code]
+        matrix = scoring.answer_matrix(
+            answers[session.code], [player.number for player in players], len(session.get_question_ids()),
+        )
+        record_game(session, players, matrix, scoring.agreement_matrix(matrix))
+    return len(sessions)
+
+def backfill(batch_size=500):
+    """Record completed games that are not in the aggregates yet; returns how many were added."""
+    recorded = 0
+    while True:
+        sessions = (
+            GameSession.query
+            .filter(GameSession.status == 'completed', GameSession.stats_recorded.is_(False))
+            .limit(batch_size)
+            .all()
+        )
+        if not sessions:
+            return recorded
+        recorded += record_sessions(sessions)
+        db.session.commit()
+
+def recent_days(limit):
+    return [rollup.to_dict() for rollup in GameRollup.query.order_by(GameRollup.day.desc()).limit(limit)]
+
+def _question_dict(question_stats, question):
+    return dict(question_stats.to_dict(), **question.to_dict())
+
+def top_questions(sort, limit, min_pairs=0):
+    """The ``limit`` questions ranked by ``sort``, read off its index."""
+    column = QUESTION_SORTS[sort]
+    rows = (
+        db.session.query(QuestionStats, Question)
+        .join(Question, Question.id == QuestionStats.question_id)
+        .filter(column.isnot(None), QuestionStats.pairs >= min_pairs)
+        .order_by(column.desc(), QuestionStats.question_id)
+        .limit(limit)
+        .all()
+    )
+    return [_question_dict(question_stats, question) for question_stats, question in rows]
+
+def question(question_id):
+    row = (
+        db.session.query(QuestionStats, Question)
+        .join(Question, Question.id == QuestionStats.question_id)
+        .filter(QuestionStats.question_id == question_id)
+        .first()
+    )
+    return _question_dict(*row) if row else None
@@ -0,0 +1,110 @@
+import os
+import shutil
+import tempfile
+from datetime import datetime, timedelta
+
+import pytest
+
+WORKDIR = tempfile.mkdtemp(prefix='know-zone-tests-')
+os.environ.update({
+    'DATABASE_URL': 'sqlite:///' + os.path.join(WORKDIR, 'quiz_game.db'),
+    'SESSION_STORE_PATH': os.path.join(WORKDIR, 'sessions.db'),
+    'MAINTENANCE_ARCHIVE_PATH': os.path.join(WORKDIR, 'archive.db'),
+    'QUESTION_PACK_PATH': os.path.join(WORKDIR, 'question_pack.db'),
+    'QUESTION_STREAMING': '0',
+    # An empty key overrides a .env file, which load_dotenv never replaces.
+    'OPENROUTER_API_KEY': '',
+    'OPENAI_API_KEY': '',
+})
+
+import app as server  # noqa: E402
+import question_bank  # noqa: E402
+from models import db, GameSession, Participant, Question  # noqa: E402
+
+FRESH_QUESTIONS = [
+    {'question': f'Fresh question {index}?', 'option1': 'Yes', 'option2': 'No'}
+    for index in range(server.QUESTIONS_PER_SESSION)
+]
+
+
+@pytest.fixture(scope='module')
+def client():
+    server.create_app()
+    yield server.app.test_client()
+    shutil.rmtree(WORKDIR, ignore_errors=True)
+
+
+def create_built_in_session(client, monkeypatch):
+    # With every banked question recently shown and the pool empty, a new session gets the built-in set.
+    monkeypatch.setattr(server.question_pool, 'take', lambda *args, **kwargs: None)
+    with server.app.app_context():
+        question_bank.mark_used([question_id for (question_id,) in db.session.query(Question.id)])
+        db.session.commit()
+    created = client.post('/api/create_session', json={'name': 'Ada'}).get_json()
+    assert created['state']['questions_key'] == server.question_set_key(server.questions[:server.QUESTIONS_PER_SESSION])
+    return created
+
+
+def make_stalled_session(code, delivered):
+    with server.app.app_context():
+        question_ids = question_bank.store_questions(delivered) if delivered else []
+        game_session_db = GameSession(
+            code=code,
+            student1_name='Ada',
+            status='waiting',
+            participant_count=1,
+            questions_ready=False,
+            created_at=datetime.utcnow() - server.QUESTION_STREAM_TIMEOUT - timedelta(seconds=1),
+        )
+        game_session_db.set_question_ids(question_ids)
+        db.session.add(game_session_db)
+        db.session.add(Participant(session_code=code, number=1, name='Ada'))
+        db.session.commit()
+
+
+def test_join_replacing_built_in_questions_reports_new_version(client, monkeypatch):
+    created = create_built_in_session(client, monkeypatch)
+    session_code = created['session_code']
+
+    monkeypatch.setattr(server.question_pool, 'take', lambda *args, **kwargs: FRESH_QUESTIONS)
+    response = client.post('/api/join_session', json={'session_code': session_code, 'name': 'Grace'})
+
+    assert response.status_code == 200
+    state = response.get_json()['state']
+    assert state['questions_key'] == server.question_set_key(FRESH_QUESTIONS)
+    with server.app.app_context():
+        assert state['version'] == db.session.get(GameSession, session_code).version
+    assert client.get(state['questions_url']).get_json()['questions'] == FRESH_QUESTIONS
+
+
+@pytest.mark.parametrize('delivered', [0, 3])
+def test_stalled_stream_is_completed_on_load(client, delivered):
+    session_code = f'T{delivered}'
+    make_stalled_session(session_code, FRESH_QUESTIONS[:delivered])
+
+    response = client.get('/api/get_session', query_string={'session_code': session_code})
+
+    assert response.status_code == 200
+    body = response.get_json()
+    assert len(body['questions']) == server.QUESTIONS_PER_SESSION
+    assert body['questions'][:delivered] == FRESH_QUESTIONS[:delivered]
+    with server.app.app_context():
+        game_session_db = db.session.get(GameSession, session_code)
+        assert game_session_db.questions_ready
+        assert body['version'] == game_session_db.version
+    state = client.get('/api/session_state', query_string={'session_code': session_code})
+    assert state.status_code == 200
+
+
+def test_join_keeps_built_in_questions_once_answered(client, monkeypatch):
+    created = create_built_in_session(client, monkeypatch)
+    session_code = created['session_code']
+    client.post('/api/submit_answer', json={
+        'session_code': session_code, 'student_number': 1, 'answer': 1, 'question_index': 0,
+    })
+
+    monkeypatch.setattr(server.question_pool, 'take', lambda *args, **kwargs: FRESH_QUESTIONS)
+    response = client.post('/api/join_session', json={'session_code': session_code, 'name': 'Grace'})
+
+    assert response.status_code == 200
+    assert response.get_json()['state']['questions_key'] == created['state']['questions_key']